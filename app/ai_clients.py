@@ -1,15 +1,14 @@
 import os
 import re
-import time
 import logging
-from typing import List, Tuple
-from xai_sdk import Client
-from xai_sdk.chat import system, user, assistant
+from typing import Callable, List, Optional, Tuple
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "1024"))
+# Bounds a single request, including one whose caller was cancelled meanwhile
+REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "300"))
+
 class AIClient:
     """
     Abstract base class for AI clients.
@@ -34,9 +33,12 @@ class AIClient:
             return code, cleaned_text
         return None, text.strip()
 
-    def query(self, history: List[dict]) -> Tuple[str, str, str]:
+    def query(self, history: List[dict], max_retries: int = None,
+              cancelled: Optional[Callable[[], bool]] = None) -> Tuple[str, str, str]:
         """
-        Queries the AI with conversation history.
+        Queries the AI with conversation history. `cancelled` is polled
+        while waiting and between retries; once it returns True the query
+        gives up.
         Returns: (original_response, code, text)
         """
         raise NotImplementedError()
@@ -56,7 +58,7 @@ class AIClient:
         """
         messages = [{"role": "system", "content": self.system_prompt}]
         for msg in history:
-            if msg['sender'] == 'user':
+            if msg['sender'] in ('user', 'nudge'):  # Nudges are loop-generated instructions to the model
                 messages.append({"role": "user", "content": msg['content']})
             elif msg['sender'] == 'assistant':
                 messages.append({"role": "user", "content": f"Jupyter output:\n{msg['content']}"})
@@ -86,51 +88,59 @@ class GrokClient(AIClient):
             raise ValueError(f"Unsupported model: {self.model}")
 
         try:
+            # Imported lazily so the web app boots without loading the provider SDK
             import xai_sdk
+            from xai_sdk import Client
             logger.info(f"xAI SDK version: {xai_sdk.__version__}")
-            self.client = Client(api_key=self.api_key)
+            self.client = Client(api_key=self.api_key, timeout=REQUEST_TIMEOUT)
             logger.info("Initialized xAI Client")
         except ImportError as e:
             logger.error("Failed to import xai_sdk: pip install xai-sdk")
             raise RuntimeError(f"xAI SDK import error: {str(e)}")
 
-    def query(self, history: List[dict], max_retries: int = 3) -> Tuple[str, str, str]:
+    def query(self, history: List[dict], max_retries: int = None,
+              cancelled: Optional[Callable[[], bool]] = None) -> Tuple[str, str, str]:
         """
-        Queries the Grok API with retry logic.
+        Queries the Grok API through the shared per-model rate limiter.
         Returns: (original_response, code, text)
         """
+        from xai_sdk.chat import system, user, assistant
+        from rate_limiter import get_limiter
+
         self.validate_history(history)
         messages = self.map_history_to_agent(history)
         logger.debug(f"Querying xAI API with messages: {messages}")
+        max_retries = max_retries or int(os.getenv("LLM_MAX_RETRIES", "6"))
+        # Rough prompt size (~4 chars per token) plus the expected completion
+        estimated_tokens = sum(len(m['content']) for m in messages) // 4 + EXPECTED_OUTPUT_TOKENS
+
+        def sample():
+            chat = self.client.chat.create(model=self.model, temperature=0)
+            logger.info(f"Started chat session with model {self.model}")
+
+            for message in messages:
+                if message['role'] == 'system':
+                    chat.append(system(message['content']))
+                elif message['role'] == 'user':
+                    chat.append(user(message['content']))
+                elif message['role'] == 'assistant':
+                    chat.append(assistant(message['content']))
+
+            return chat.sample()
+
+        try:
+            response = get_limiter("grok", self.model).call(sample, estimated_tokens, max_retries, cancelled)
+        except Exception as e:
+            raise RuntimeError(f"Query failed after {max_retries} attempts: {str(e)}")
 
-        for attempt in range(max_retries):
-            try:
-                chat = self.client.chat.create(model=self.model, temperature=0)
-                logger.info(f"Started chat session with model {self.model}")
-
-                for message in messages:
-                    if message['role'] == 'system':
-                        chat.append(system(message['content']))
-                    elif message['role'] == 'user':
-                        chat.append(user(message['content']))
-                    elif message['role'] == 'assistant':
-                        chat.append(assistant(message['content']))
-
-                response = chat.sample()
-                logger.info(f"Received response from xAI API")
-                if hasattr(response, 'content'):
-                    original = response.content.strip()
-                    code, text = self.extract_code_and_clean_text(original)
-                    return original, code, text
-                else:
-                    logger.warning("Response has no content attribute")
-                    return "", None, ""
-            except Exception as e:
-                logger.error(f"Attempt {attempt + 1} failed: {str(e)}")
-                if attempt == max_retries - 1:
-                    raise RuntimeError(f"Query failed after {max_retries} attempts: {str(e)}")
-                time.sleep(2 ** attempt)  # Exponential backoff
-        return "", None, ""
+        logger.info(f"Received response from xAI API")
+        if hasattr(response, 'content'):
+            original = response.content.strip()
+            code, text = self.extract_code_and_clean_text(original)
+            return original, code, text
+        else:
+            logger.warning("Response has no content attribute")
+            return "", None, ""
 
 def get_client(name: str, model: str = None, system_prompt: str = None) -> AIClient:
     """
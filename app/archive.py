@@ -0,0 +1,121 @@
+import json
+import zlib
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from models import ArchivedConversation, Message
+
+logger = logging.getLogger(__name__)
+
+try:  # Optional: better ratio and much faster decompression when installed
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the deployment
+    zstandard = None
+
+TERMINAL_STATUSES = ("success", "failed", "stopped")
+
+@dataclass
+class ArchivedMessage:
+    """
+    Read-only stand-in for a Message row restored from an archive.
+    Exposes the attributes templates and API serializers use.
+    """
+    id: int
+    sender: str
+    content: str
+    timestamp: Optional[datetime]
+
+def compress(data: bytes) -> Tuple[str, bytes]:
+    """
+    Compresses data with the best available codec.
+    Returns: (codec, payload)
+    """
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(data)
+    return "zlib", zlib.compress(data, 9)
+
+def decompress(codec: str, payload: bytes) -> bytes:
+    """
+    Decompresses a payload written by compress().
+    """
+    if codec == "zlib":
+        return zlib.decompress(payload)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Archive is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    raise ValueError(f"Unknown archive codec: {codec}")
+
+def _serialize(messages: List[Message]) -> bytes:
+    rows = [
+        [m.id, m.sender, m.content, m.timestamp.isoformat() if m.timestamp else None]
+        for m in messages
+    ]
+    return json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _deserialize(data: bytes) -> List[ArchivedMessage]:
+    return [
+        ArchivedMessage(
+            id=row[0],
+            sender=row[1],
+            content=row[2],
+            timestamp=datetime.fromisoformat(row[3]) if row[3] else None,
+        )
+        for row in json.loads(data)
+    ]
+
+def unpack(archived: ArchivedConversation) -> List[ArchivedMessage]:
+    """
+    Decompresses an archived conversation back into messages.
+    """
+    return _deserialize(decompress(archived.codec, archived.payload))
+
+def archive_experiment(db, experiment_id: str) -> bool:
+    """
+    Compacts the messages of a finished experiment into one compressed blob
+    and deletes the individual rows. Empty conversations are archived too so
+    they are not reconsidered on every pass. Returns False if already archived.
+    The caller owns the transaction.
+    """
+    if db.query(ArchivedConversation).get(experiment_id) is not None:
+        return False
+
+    messages = (
+        db.query(Message)
+        .filter(Message.experiment_id == experiment_id)
+        .order_by(Message.timestamp.asc(), Message.id.asc())
+        .all()
+    )
+
+    raw = _serialize(messages)
+    codec, payload = compress(raw)
+    db.add(ArchivedConversation(
+        experiment_id=experiment_id,
+        codec=codec,
+        payload=payload,
+        message_count=len(messages),
+        raw_size=len(raw),
+    ))
+    db.query(Message).filter(Message.experiment_id == experiment_id).delete(synchronize_session=False)
+    logger.info(
+        f"Archived {len(messages)} messages for experiment {experiment_id} "
+        f"({len(raw)} -> {len(payload)} bytes, {codec})"
+    )
+    return True
+
+def load_messages(db, experiment_id: str) -> list:
+    """
+    Returns the conversation of an experiment in chronological order,
+    transparently decompressing it when it has been archived.
+    """
+    archived = db.query(ArchivedConversation).get(experiment_id)
+    if archived is not None:
+        return unpack(archived)
+    return (
+        db.query(Message)
+        .filter(Message.experiment_id == experiment_id)
+        .order_by(Message.timestamp.asc())
+        .all()
+    )
@@ -0,0 +1,90 @@
+"""
+Startup-time benchmark.
+
+Measures, in fresh interpreter processes so nothing is cached between runs:
+  - import latency of `main` (what every gunicorn worker pays on boot)
+  - app construction plus first-request latency of GET /
+
+Usage: python bench_startup.py [--runs 5] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+IMPORT_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import main
+print(time.perf_counter() - t0)
+"""
+
+FIRST_REQUEST_SNIPPET = """
+import time
+t0 = time.perf_counter()
+from fastapi.testclient import TestClient
+import main
+t1 = time.perf_counter()
+with TestClient(main.app) as client:
+    t2 = time.perf_counter()
+    response = client.get("/")
+    t3 = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(t1 - t0, t2 - t1, t3 - t2)
+"""
+
+def _run(snippet: str, env: dict) -> list:
+    """
+    Runs a snippet in a fresh interpreter and returns the floats it prints.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", snippet],
+        cwd=BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return [float(value) for value in result.stdout.split()]
+
+def _summary(samples: list) -> dict:
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 2),
+        "min_ms": round(min(samples) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark import and first-request latency")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env["DATABASE_PATH"] = os.path.join(tmp, "bench.sqlite3")
+        env.pop("DATABASE_URL", None)
+
+        imports = [_run(IMPORT_SNIPPET, env)[0] for _ in range(args.runs)]
+        first = [_run(FIRST_REQUEST_SNIPPET, env) for _ in range(args.runs)]
+
+    results = {
+        "import_main": _summary(imports),
+        "import_with_testclient": _summary([row[0] for row in first]),
+        "startup_lifespan": _summary([row[1] for row in first]),
+        "first_request": _summary([row[2] for row in first]),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, stats in results.items():
+        print(f"{name:<24} median {stats['median_ms']:>8} ms  (min {stats['min_ms']}, max {stats['max_ms']})")
+
+if __name__ == "__main__":
+    main()
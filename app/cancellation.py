@@ -0,0 +1,208 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, TypeVar
+
+from models import Experiment
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Per-experiment limits; 0 disables. The absolute deadline and the tokens
+# used are kept in LoopState, so resuming after a restart does not reset them
+DEADLINE_SECONDS = float(os.getenv("EXPERIMENT_DEADLINE_SECONDS", "3600"))
+TOKEN_BUDGET = int(os.getenv("EXPERIMENT_TOKEN_BUDGET", "0"))
+
+class Cancelled(Exception):
+    """
+    Raised inside a feedback loop whose experiment was cancelled.
+    """
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class CancellationToken:
+    """
+    Cancellation state of one running experiment. Set by a user stop, a
+    wall-clock deadline or an exhausted token budget; checked by the loop
+    between phases and able to interrupt the phase in flight.
+    """
+    def __init__(self, experiment_id: str, deadline_seconds: Optional[float] = None, token_budget: int = 0,
+                 tokens_used: int = 0):
+        self.experiment_id = experiment_id
+        # A deadline already in the past (negative seconds) cancels on the first check
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds is not None else None
+        self.token_budget = token_budget
+        self.tokens_used = tokens_used
+        self.reason: Optional[str] = None
+        self.user_requested = False
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str, user_requested: bool = False) -> None:
+        """
+        Cancels once and runs the registered callbacks (e.g. kernel interrupt).
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self.user_requested = user_requested
+            self._event.set()
+            callbacks = list(self._callbacks)
+        logger.info(f"Cancelling experiment {self.experiment_id}: {reason}")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Cancellation callback failed for experiment {self.experiment_id}: {str(e)}")
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Registers a callback for the current phase; returns its remover.
+        Runs immediately if the token is already cancelled.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def _remaining(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def check(self) -> None:
+        """
+        Raises Cancelled if the experiment was cancelled or ran out of time.
+        """
+        remaining = self._remaining()
+        if remaining is not None and remaining <= 0:
+            self.cancel("wall-clock deadline exceeded")
+        if self._event.is_set():
+            raise Cancelled(self.reason)
+
+    def spend(self, tokens: int) -> None:
+        """
+        Charges tokens against the budget, cancelling once it is exhausted.
+        """
+        self.tokens_used += tokens
+        if self.token_budget and self.tokens_used >= self.token_budget:
+            self.cancel(f"token budget exhausted ({self.tokens_used}/{self.token_budget} tokens)")
+
+    def wait(self, seconds: float) -> None:
+        """
+        Sleeps, returning early (via Cancelled) when cancelled or out of time.
+        """
+        remaining = self._remaining()
+        self._event.wait(seconds if remaining is None else max(0, min(seconds, remaining)))
+        self.check()
+
+    def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Runs a blocking call (e.g. an LLM request) in a helper thread and
+        abandons it as soon as the token is cancelled. The abandoned call
+        finishes in the background and its result is discarded; give it a
+        cancelled hook (see ProviderLimiter.call) so it stops queueing and
+        retrying, and a client timeout to bound the request in flight.
+        """
+        self.check()
+        outcome = {}
+        done = threading.Event()
+
+        def target():
+            try:
+                outcome["value"] = fn(*args, **kwargs)
+            except BaseException as e:
+                outcome["error"] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=target, name=f"cancellable-{self.experiment_id[:8]}", daemon=True).start()
+        while not done.wait(0.25):
+            self.check()
+        self.check()  # The call may have failed because it saw the cancellation first
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["value"]
+
+_tokens: Dict[str, CancellationToken] = {}
+_tokens_lock = threading.Lock()
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def register(experiment_id: str, deadline_at: Optional[datetime] = None, token_budget: int = None,
+             tokens_used: int = 0) -> CancellationToken:
+    """
+    Creates the token for an experiment this process is about to run.
+    `deadline_at` is the absolute UTC deadline stored with the loop state
+    (None for no deadline); `tokens_used` is what earlier runs already spent.
+    """
+    deadline_seconds = None
+    if deadline_at is not None:
+        if deadline_at.tzinfo is not None:
+            deadline_at = deadline_at.astimezone(timezone.utc).replace(tzinfo=None)
+        deadline_seconds = (deadline_at - _utcnow()).total_seconds()
+    token = CancellationToken(
+        experiment_id,
+        deadline_seconds=deadline_seconds,
+        token_budget=TOKEN_BUDGET if token_budget is None else token_budget,
+        tokens_used=tokens_used,
+    )
+    with _tokens_lock:
+        _tokens[experiment_id] = token
+    return token
+
+def unregister(experiment_id: str) -> None:
+    with _tokens_lock:
+        _tokens.pop(experiment_id, None)
+
+def cancel(experiment_id: str, reason: str = "stopped by user") -> bool:
+    """
+    Cancels an experiment running in this process. Returns False if it is
+    not running here (another process picks it up via cancel_stopped).
+    """
+    with _tokens_lock:
+        token = _tokens.get(experiment_id)
+    if token is None:
+        return False
+    token.cancel(reason, user_requested=True)
+    return True
+
+def cancel_stopped(session_factory: Callable) -> int:
+    """
+    Cancels local loops whose experiment was stopped or deleted through
+    another process. Run periodically next to the loop heartbeat.
+    """
+    with _tokens_lock:
+        running = [eid for eid, token in _tokens.items() if not token.cancelled]
+    if not running:
+        return 0
+    db = session_factory()
+    try:
+        stopped = [
+            row.id for row in
+            db.query(Experiment.id).filter(
+                Experiment.id.in_(running),
+                (Experiment.deleted_at.isnot(None)) | (Experiment.status == "stopped"),
+            ).all()
+        ]
+    finally:
+        db.close()
+    for experiment_id in stopped:
+        cancel(experiment_id)
+    return len(stopped)
@@ -0,0 +1,114 @@
+import re
+import ast
+import hashlib
+import logging
+from typing import Optional, Set
+
+from executor import ExecutionResult
+
+logger = logging.getLogger(__name__)
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+
+# Only real file locations are masked; other text with slashes (a/b, URLs,
+# dtypes) is part of what distinguishes one error from another
+TRACEBACK_FILE = re.compile(r'File "[^"]+"')
+SOURCE_PATH = re.compile(r"(?<![\w.])(?:[A-Za-z]:)?[\\/](?:[\w.-]+[\\/])*[\w.-]+\.pyx?\b")
+
+# Verdicts returned by StagnationDetector.observe
+CONTINUE = "continue"
+ESCALATE = "escalate"
+STOP = "stop"
+
+def strip_ansi(text: str) -> str:
+    return ANSI_ESCAPE.sub("", text or "")
+
+def code_fingerprint(code: str) -> str:
+    """
+    Hashes code so formatting-only and comment-only changes compare equal.
+    Falls back to whitespace/comment-stripped text when the code does not parse.
+    """
+    try:
+        normalized = ast.dump(ast.parse(code), annotate_fields=False, include_attributes=False)
+    except (SyntaxError, ValueError):
+        lines = (line.split("#", 1)[0].strip() for line in code.splitlines())
+        normalized = "\n".join(line for line in lines if line)
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+def error_signature(result: ExecutionResult) -> Optional[str]:
+    """
+    Normalizes an execution error so the same failure compares equal across
+    iterations: exception type plus message with addresses, numbers and
+    source file paths masked. Returns None for successful executions.
+    """
+    if result.ok:
+        return None
+    if result.timed_out:
+        return "TimeoutError"
+    message = strip_ansi(result.evalue or "")
+    if not result.ename:
+        # No structured fields (e.g. older backends); use the last traceback line
+        lines = [line for line in strip_ansi(result.error).splitlines() if line.strip()]
+        message = lines[-1] if lines else ""
+    message = re.sub(r"0x[0-9a-fA-F]+", "<addr>", message)
+    message = TRACEBACK_FILE.sub('File "<path>"', message)
+    message = SOURCE_PATH.sub("<path>", message)
+    message = re.sub(r"\d+", "N", message)
+    return f"{result.ename or 'Error'}: {message.strip()}"
+
+def classify(result: Optional[ExecutionResult]) -> str:
+    """
+    Structured outcome of an iteration: 'no_code', 'success', 'timeout' or 'error'.
+    Output text is never inspected, so a program printing "Error" still succeeds.
+    """
+    if result is None:
+        return "no_code"
+    if result.timed_out:
+        return "timeout"
+    return "success" if result.ok else "error"
+
+class StagnationDetector:
+    """
+    Tracks generated code and error signatures across iterations and flags
+    cycles (code already tried) and no-progress streaks (the same error
+    repeated). The first stagnation escalates; once escalations are used up
+    it asks the loop to stop.
+    """
+    def __init__(self, streak_limit: int = 2, max_escalations: int = 1):
+        self.streak_limit = streak_limit
+        self.max_escalations = max_escalations
+        self.escalations = 0
+        self.seen_code: Set[str] = set()
+        self.last_error: Optional[str] = None
+        self.streak = 0
+        self.reason: Optional[str] = None
+
+    def observe(self, code: Optional[str], result: Optional[ExecutionResult]) -> str:
+        """
+        Records one iteration and returns CONTINUE, ESCALATE or STOP.
+        """
+        self.reason = None
+        signature = error_signature(result) if result is not None else None
+
+        if code is not None:
+            fingerprint = code_fingerprint(code)
+            if fingerprint in self.seen_code:
+                self.reason = "model returned code it already tried"
+            self.seen_code.add(fingerprint)
+
+        if signature is not None and signature == self.last_error:
+            self.streak += 1
+        else:
+            self.streak = 1 if signature is not None else 0
+        self.last_error = signature
+        if self.reason is None and self.streak >= self.streak_limit:
+            self.reason = f"same error {self.streak} times in a row: {signature}"
+
+        if self.reason is None:
+            return CONTINUE
+        if self.escalations < self.max_escalations:
+            self.escalations += 1
+            # A fresh strategy deserves a fresh streak
+            self.streak = 0
+            return ESCALATE
+        return STOP
@@ -1,5 +1,7 @@
 from sqlalchemy.sql import func
 from models import Message
+from search import index_message
+from stats import record_message
 
 class Conversation:
     """
@@ -9,15 +11,19 @@ class Conversation:
         self.db = db
         self.experiment_id = experiment_id
 
-    def append(self, sender: str, content: str):
+    def append(self, sender: str, content: str, timestamp=None) -> Message:
         """
-        Appends a message to the conversation.
+        Appends a message to the conversation and to the full-text index.
         """
         msg = Message(
             experiment_id=self.experiment_id,
             sender=sender,
             content=content,
-            timestamp=func.now()
+            timestamp=timestamp or func.now()
         )
         self.db.add(msg)
-        self.db.commit()
\ No newline at end of file
+        self.db.flush()
+        index_message(self.db, msg.id, self.experiment_id, sender, content)
+        record_message(self.db, sender)
+        self.db.commit()
+        return msg
\ No newline at end of file
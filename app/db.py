@@ -1,59 +1,134 @@
 import os
 import logging
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import OperationalError
+from starlette.exceptions import HTTPException
 from models import Base
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
-from fastapi import Depends
 from sqlalchemy.orm import Session
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s"
-)
 logger = logging.getLogger(__name__)
 
 def get_database_uri() -> str:
     """
     Retrieves the database URI, configurable via environment variables.
-    Defaults to SQLite in the data directory.
+    DATABASE_URL takes precedence; otherwise defaults to SQLite in the data directory.
     """
+    url = os.getenv("DATABASE_URL")
+    if url:
+        return url
+
     base_dir = os.path.abspath(os.path.dirname(__file__))
     data_dir = os.path.join(base_dir, "..", "data")
     default_db_path = os.path.join(data_dir, "db.sqlite3")
-    
+
     db_path = os.getenv("DATABASE_PATH", default_db_path)
-    
+    return f"sqlite:///{db_path}"
+
+def is_sqlite(bind) -> bool:
+    """
+    Returns True when the engine or connection targets SQLite.
+    """
+    return bind.dialect.name == "sqlite"
+
+def _ensure_database_directory(uri: str) -> None:
+    """
+    Creates the directory holding a file-backed SQLite database.
+    """
+    url = make_url(uri)
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:":
+        return
+    directory = os.path.dirname(os.path.abspath(url.database))
     try:
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        logger.info(f"Ensured database directory exists at {os.path.dirname(db_path)}")
+        os.makedirs(directory, exist_ok=True)
+        logger.info(f"Ensured database directory exists at {directory}")
     except OSError as e:
         logger.error(f"Failed to create database directory: {str(e)}")
         raise RuntimeError(f"Cannot create database directory: {str(e)}")
-    
-    return f"sqlite:///{db_path}"
+
+def _add_missing_columns(engine) -> None:
+    """
+    Adds columns introduced after a table was first created.
+    create_all never alters existing tables, so new columns are added here
+    with plain ALTER TABLE statements; NOT NULL columns need a scalar default.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                if isinstance(default, (int, float)) and not isinstance(default, bool):
+                    ddl += f" NOT NULL DEFAULT {default}" if not column.nullable else f" DEFAULT {default}"
+                conn.execute(text(ddl))
+                logger.info(f"Added column {table.name}.{column.name}")
+
+def _add_missing_indexes(engine) -> None:
+    """
+    Creates indexes declared after a table was first created.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def _configure_sqlite(engine) -> None:
+    """
+    Enables incremental auto-vacuum so freed pages can be returned to the OS
+    without a full VACUUM. Only takes effect on a new database file or after
+    the next full VACUUM (run by the retention job).
+    """
+    with engine.begin() as conn:
+        mode = conn.execute(text("PRAGMA auto_vacuum")).scalar()
+        if mode != 2:
+            conn.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
 
 def initialize_database(engine) -> None:
     """
     Initializes the database by creating tables if they don't exist.
     """
     try:
+        if is_sqlite(engine):
+            _configure_sqlite(engine)
         Base.metadata.create_all(bind=engine)
+        _add_missing_columns(engine)
+        _add_missing_indexes(engine)
         logger.info("Database tables initialized successfully")
     except OperationalError as e:
         logger.error(f"Failed to initialize database tables: {str(e)}")
         raise RuntimeError(f"Database initialization failed: {str(e)}")
 
+def init_db() -> None:
+    """
+    Explicit schema initialization / migration step.
+    Run once at deploy time (`python db.py`) or from the app lifespan;
+    importing this module never touches the filesystem or the database.
+    """
+    from search import init_search_index
+    from stats import init_stats
+
+    _ensure_database_directory(SQLALCHEMY_DATABASE_URI)
+    initialize_database(engine)
+    init_search_index(engine)
+    init_stats(engine)
+
 # Get database URI
 SQLALCHEMY_DATABASE_URI = get_database_uri()
 
-# Create engine
+# Create engine (lazy: no connection is opened until first use, so the
+# engine is safe to build before gunicorn forks its workers)
 engine = create_engine(
     SQLALCHEMY_DATABASE_URI,
-    connect_args={"check_same_thread": False},
+    connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URI.startswith("sqlite") else {},
     pool_pre_ping=True,
     echo=False
 )
@@ -75,6 +150,9 @@ async def get_db() -> AsyncGenerator[Session, None]:
     db = SessionLocal()
     try:
         yield db
+    except HTTPException:
+        db.rollback()  # A deliberate error response (e.g. a 400), not a session failure
+        raise
     except Exception as e:
         db.rollback()
         logger.error(f"Database session error: {str(e)}")
@@ -87,9 +165,8 @@ async def get_session():
     async with get_db() as session:
         yield session
 
-# Initialize database on module import
-try:
-    initialize_database(engine)
-except Exception as e:
-    logger.critical(f"Failed to initialize database: {str(e)}")
-    raise
\ No newline at end of file
+if __name__ == "__main__":
+    from logging_config import configure_logging
+
+    configure_logging()
+    init_db()
@@ -1,17 +1,43 @@
-from jupyter_client import KernelManager
+from dataclasses import dataclass
 from queue import Empty
+from typing import Callable, Optional
 import time
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+@dataclass
+class ExecutionResult:
+    """
+    Outcome of one cell execution.
+    """
+    output: str = ""
+    error: Optional[str] = None  # Full traceback text
+    ename: Optional[str] = None  # Exception class name, e.g. ModuleNotFoundError
+    evalue: Optional[str] = None  # Exception message
+    timed_out: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def render(self) -> str:
+        """
+        Formats the result the way the conversation stores it.
+        """
+        if self.error:
+            return f"Error:\n{self.error}"
+        return self.output
+
 class JupyterExecutor:
     """
     Manages a persistent Jupyter Python kernel for code execution.
     """
     def __init__(self):
+        # Imported lazily: jupyter_client pulls in zmq, which the web tier never needs at boot
+        from jupyter_client import KernelManager
+
+        self.environment_key = "local:python3"  # Identifies the package set for validation caches
         self.km = KernelManager(kernel_name="python3")
         self.km.start_kernel()
         self.kc = self.km.client()
@@ -29,13 +55,14 @@ class JupyterExecutor:
             logger.error("Jupyter kernel not ready within timeout")
             raise RuntimeError("Jupyter kernel not ready within timeout")
 
-    def execute(self, code: str, timeout: int = 30) -> str:
+    def execute_structured(self, code: str, timeout: int = 30, on_output: Optional[Callable[[str], None]] = None) -> ExecutionResult:
         """
-        Executes code in the kernel and returns combined output or error.
+        Executes code in the kernel and returns output and error details separately.
+        `on_output` is called with each piece of output as it arrives on iopub.
         """
         msg_id = self.kc.execute(code)
+        result = ExecutionResult()
         output = []
-        error = None
         start_time = time.time()
 
         while True:
@@ -43,7 +70,9 @@ class JupyterExecutor:
                 msg = self.kc.get_iopub_msg(timeout=1)
             except Empty:
                 if time.time() - start_time > timeout:
-                    error = "Execution timeout"
+                    result.timed_out = True
+                    result.ename = "TimeoutError"
+                    result.error = "Execution timeout"
                     break
                 continue
 
@@ -56,20 +85,42 @@ class JupyterExecutor:
 
             if msg_type == 'stream':
                 output.append(msg['content']['text'])
+                if on_output:
+                    on_output(msg['content']['text'])
 
             if msg_type == 'error':
-                error = "\n".join(msg['content']['traceback'])
+                result.ename = msg['content'].get('ename')
+                result.evalue = msg['content'].get('evalue')
+                result.error = "\n".join(msg['content']['traceback'])
                 break
 
             if msg_type == 'execute_result' or msg_type == 'display_data':
                 data = msg['content']['data']
                 if 'text/plain' in data:
                     output.append(data['text/plain'])
+                    if on_output:
+                        on_output(data['text/plain'])
 
-        if error:
-            logger.error(f"Execution error: {error}")
-            return f"Error:\n{error}"
-        return "".join(output).strip()
+        result.output = "".join(output).strip()
+        if result.error:
+            logger.error(f"Execution error: {result.error}")
+        return result
+
+    def interrupt(self):
+        """
+        Interrupts the running cell (like Ctrl-C); the kernel and its state survive.
+        """
+        try:
+            self.km.interrupt_kernel()
+            logger.info("Jupyter kernel interrupted")
+        except Exception as e:
+            logger.error(f"Error interrupting kernel: {str(e)}")
+
+    def execute(self, code: str, timeout: int = 30) -> str:
+        """
+        Executes code in the kernel and returns combined output or error.
+        """
+        return self.execute_structured(code, timeout).render()
 
     def shutdown(self):
         """
@@ -0,0 +1,275 @@
+import os
+import json
+import queue
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from executor import ExecutionResult, JupyterExecutor
+from models import Worker
+from worker import WORKER_TOKEN_HEADER
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_TIMEOUT = float(os.getenv("WORKER_HEARTBEAT_TIMEOUT", "30"))
+
+class ExecutorBackend:
+    """
+    Hands out executors: objects with execute_structured(), execute(),
+    interrupt(), shutdown() and an environment_key.
+    """
+    def acquire(self):
+        raise NotImplementedError()
+
+    def shutdown(self):
+        pass
+
+class WarmKernelPool:
+    """
+    Keeps a few Jupyter kernels started ahead of time so queued experiments
+    do not each pay kernel boot latency. Kernels are handed out once and
+    never reused, so experiments stay isolated.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self._ready: "queue.Queue[JupyterExecutor]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._starting = 0
+
+    def acquire(self) -> JupyterExecutor:
+        """
+        Returns a ready kernel, starting one inline if none is warm.
+        """
+        try:
+            executor = self._ready.get_nowait()
+        except queue.Empty:
+            executor = JupyterExecutor()
+        self._refill()
+        return executor
+
+    def _refill(self):
+        with self._lock:
+            missing = self.size - self._ready.qsize() - self._starting
+            self._starting += max(missing, 0)
+        for _ in range(max(missing, 0)):
+            threading.Thread(target=self._start_one, daemon=True).start()
+
+    def _start_one(self):
+        try:
+            self._ready.put(JupyterExecutor())
+        except Exception as e:
+            logger.error(f"Failed to pre-start kernel: {str(e)}")
+        finally:
+            with self._lock:
+                self._starting -= 1
+
+    def shutdown(self):
+        while True:
+            try:
+                self._ready.get_nowait().shutdown()
+            except queue.Empty:
+                break
+
+class LocalBackend(ExecutorBackend):
+    """
+    Kernels in this process's container (the original behaviour).
+    """
+    def __init__(self, warm_kernels: int = None):
+        warm_kernels = warm_kernels if warm_kernels is not None else int(os.getenv("WARM_KERNELS", "2"))
+        self.pool = WarmKernelPool(warm_kernels)
+
+    def acquire(self) -> JupyterExecutor:
+        return self.pool.acquire()
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+def _stream_lines(response):
+    """
+    Yields NDJSON lines as soon as each arrives. iter_lines() waits for a full
+    chunk first, which holds back short outputs until the cell finishes.
+    """
+    read1 = getattr(response.raw, "read1", None)
+    if read1 is None:  # urllib3 < 2
+        yield from response.iter_lines(chunk_size=1)
+        return
+    pending = b""
+    while True:
+        data = read1(65536)
+        if not data:
+            break
+        *lines, pending = (pending + data).split(b"\n")
+        yield from lines
+    if pending:
+        yield pending
+
+class RemoteExecutor:
+    """
+    Client side of a kernel lease on a remote worker (see worker.py).
+    Mirrors the JupyterExecutor interface.
+    """
+    def __init__(self, worker_url: str, kernel_id: str, environment: Optional[str], token: Optional[str] = None):
+        import requests
+
+        self.worker_url = worker_url.rstrip("/")
+        self.kernel_id = kernel_id
+        self.environment_key = f"remote:{environment or worker_url}"
+        self._session = requests.Session()
+        if token:
+            self._session.headers[WORKER_TOKEN_HEADER] = token
+
+    def execute_structured(self, code: str, timeout: int = 30, on_output: Optional[Callable[[str], None]] = None) -> ExecutionResult:
+        """
+        Runs code on the leased kernel, relaying output as the worker streams it.
+        """
+        response = self._session.post(
+            f"{self.worker_url}/kernels/{self.kernel_id}/execute",
+            json={"code": code, "timeout": timeout},
+            stream=True,
+            timeout=(5, timeout + 30),
+        )
+        response.raise_for_status()
+        for line in _stream_lines(response):
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["type"] == "output" and on_output:
+                on_output(event["text"])
+            elif event["type"] == "result":
+                return ExecutionResult(
+                    output=event["output"],
+                    error=event["error"],
+                    ename=event["ename"],
+                    evalue=event["evalue"],
+                    timed_out=event["timed_out"],
+                )
+        raise RuntimeError(f"Worker {self.worker_url} closed the stream without a result")
+
+    def execute(self, code: str, timeout: int = 30) -> str:
+        return self.execute_structured(code, timeout).render()
+
+    def interrupt(self):
+        """
+        Interrupts the running cell. Called from another thread while
+        execute_structured streams, so it does not share the session.
+        """
+        import requests
+
+        try:
+            requests.post(
+                f"{self.worker_url}/kernels/{self.kernel_id}/interrupt",
+                headers=dict(self._session.headers),
+                timeout=5,
+            ).raise_for_status()
+            logger.info(f"Interrupted kernel {self.kernel_id} on {self.worker_url}")
+        except Exception as e:
+            logger.error(f"Error interrupting kernel {self.kernel_id} on {self.worker_url}: {str(e)}")
+
+    def shutdown(self):
+        try:
+            self._session.delete(f"{self.worker_url}/kernels/{self.kernel_id}", timeout=10)
+            logger.info(f"Released kernel {self.kernel_id} on {self.worker_url}")
+        except Exception as e:
+            logger.error(f"Error releasing kernel {self.kernel_id} on {self.worker_url}: {str(e)}")
+        finally:
+            self._session.close()
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def record_heartbeat(db, url: str, capacity: int, active: int, environment: Optional[str]) -> None:
+    """
+    Registers a worker or refreshes its capacity and load.
+    """
+    worker = db.query(Worker).get(url)
+    if worker is None:
+        worker = Worker(url=url)
+        db.add(worker)
+        logger.info(f"Registered worker {url} (capacity {capacity})")
+    worker.capacity = capacity
+    worker.active = active
+    worker.environment = environment
+    worker.last_heartbeat = _utcnow()
+    db.commit()
+
+class RemoteBackend(ExecutorBackend):
+    """
+    Leases kernels from registered workers, least-loaded first.
+    """
+    def __init__(self, session_factory: Callable, token: Optional[str] = None):
+        import requests
+
+        self.session_factory = session_factory
+        self.token = token if token is not None else os.getenv("WORKER_TOKEN")
+        if not self.token:
+            # Without it anyone could register a URL and receive user code
+            raise RuntimeError("The remote executor backend requires WORKER_TOKEN")
+        self._http = requests.Session()
+        self._http.headers[WORKER_TOKEN_HEADER] = self.token
+
+    def acquire(self) -> RemoteExecutor:
+        db = self.session_factory()
+        try:
+            cutoff = _utcnow() - timedelta(seconds=HEARTBEAT_TIMEOUT)
+            workers = [
+                w for w in db.query(Worker).filter(Worker.last_heartbeat >= cutoff).all()
+                if w.active < w.capacity
+            ]
+            workers.sort(key=lambda w: w.active / w.capacity)
+            for worker in workers:
+                try:
+                    response = self._http.post(f"{worker.url}/kernels", timeout=(5, 60))
+                except Exception as e:
+                    logger.warning(f"Worker {worker.url} unreachable: {str(e)}")
+                    continue
+                if response.status_code == 409:
+                    continue  # Filled up since its last heartbeat
+                if not response.ok:
+                    # e.g. the kernel failed to start there; try the next worker
+                    logger.warning(f"Worker {worker.url} could not lease a kernel: HTTP {response.status_code} {response.text[:200]}")
+                    continue
+                # Count the lease now so concurrent placements see it before the next heartbeat
+                db.query(Worker).filter(Worker.url == worker.url).update({Worker.active: Worker.active + 1})
+                db.commit()
+                kernel_id = response.json()["kernel_id"]
+                logger.info(f"Leased kernel {kernel_id} on {worker.url}")
+                return RemoteExecutor(worker.url, kernel_id, worker.environment, self.token)
+        finally:
+            db.close()
+        raise RuntimeError("No execution worker with free capacity is available")
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def remote_backend_enabled() -> bool:
+    return os.getenv("EXECUTOR_BACKEND", "local").lower() == "remote"
+
+def check_backend_config() -> None:
+    """
+    Fails fast at startup on a backend configuration that cannot run safely.
+    """
+    if remote_backend_enabled() and not os.getenv("WORKER_TOKEN"):
+        raise RuntimeError("EXECUTOR_BACKEND=remote requires WORKER_TOKEN to authenticate workers")
+
+def get_backend() -> ExecutorBackend:
+    """
+    Returns the process-wide backend selected by EXECUTOR_BACKEND (local or remote).
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if remote_backend_enabled():
+                from db import SessionLocal
+
+                _backend = RemoteBackend(SessionLocal)
+            else:
+                _backend = LocalBackend()
+        return _backend
+
+def shutdown_backend() -> None:
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.shutdown()
+            _backend = None
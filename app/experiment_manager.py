@@ -1,16 +1,22 @@
+import os
 import threading
 import uuid
 import logging
-from typing import Callable
+from typing import Callable, List, Tuple
 
-from models import Experiment
+
+import cancellation
+from loop_state import claim_new, load_state, loop_deadline, process_owner_id
+from models import Batch, Experiment, LoopState
 from conversation import Conversation
 from feedback_loop import run_feedback_loop
-from executor import JupyterExecutor
+from executor_backends import get_backend
 from ai_clients import get_client
+from scheduler import get_scheduler
+from stats import record_created, set_status
+from validation import CodeValidator
+from websocket_manager import manager as ws_manager
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 class ExperimentManager:
@@ -33,12 +39,15 @@ class ExperimentManager:
             status='pending'
         )
         self.db.add(experiment)
+        self.db.flush()
+        claim_new(self.db, experiment.id)
+        record_created(self.db, f"{ai_choice}:{model}")
         self.db.commit()
 
         try:
             conversation = Conversation(self.db, experiment.id)
             ai_client = get_client(ai_choice, model)
-            executor = JupyterExecutor()
+            executor = get_backend().acquire()
 
             thread = threading.Thread(
                 target=self._run_in_thread,
@@ -48,7 +57,7 @@ class ExperimentManager:
             thread.start()
         except Exception as e:
             logger.error(f"Error starting experiment {experiment.id}: {str(e)}")
-            experiment.status = 'failed'
+            set_status(self.db, experiment, 'failed')
             self.db.commit()
             with open("experiment_errors.log", "a") as log_file:
                 log_file.write(f"Experiment ID: {experiment.id} — Error: {str(e)}\n")
@@ -56,12 +65,105 @@ class ExperimentManager:
 
         return experiment.id
 
+    def start_batch(self, prompts: List[str], models: List[Tuple[str, str]]) -> Tuple[str, List[str]]:
+        """
+        Creates one experiment per prompt x model in a single bulk insert,
+        groups them under a batch and queues them on the shared scheduler.
+        Returns: (batch_id, experiment_ids)
+        """
+        scheduler = get_scheduler()
+        # Resolve every client up front so a bad model fails the request, not each item
+        for ai_choice, model in models:
+            scheduler.client_for(ai_choice, model)
+
+        batch_id = str(uuid.uuid4())
+        # Prompt-major order interleaves models, spreading load across provider limits
+        rows = [
+            {
+                "id": str(uuid.uuid4()),
+                "prompt": prompt,
+                "ai_client": ai_choice,
+                "model": model,
+                "status": "pending",
+                "batch_id": batch_id,
+            }
+            for prompt in prompts
+            for ai_choice, model in models
+        ]
+        self.db.add(Batch(id=batch_id, size=len(rows)))
+        self.db.flush()
+        self.db.bulk_insert_mappings(Experiment, rows)
+        self.db.bulk_insert_mappings(LoopState, [
+            {"experiment_id": row["id"], "owner": process_owner_id()} for row in rows
+        ])
+        for ai_choice, model in models:
+            record_created(self.db, f"{ai_choice}:{model}", len(prompts))
+        self.db.commit()
+
+        for row in rows:
+            scheduler.submit(self._run_queued, row["id"])
+        logger.info(f"Queued batch {batch_id} with {len(rows)} experiments")
+        return batch_id, [row["id"] for row in rows]
+
+    def resume(self, experiment_id: str):
+        """
+        Re-queues an experiment recovered from a dead process; the loop
+        picks up from its last completed iteration.
+        """
+        get_scheduler().submit(self._run_queued, experiment_id)
+
+    def _run_queued(self, experiment_id: str):
+        """
+        Scheduler entry point: runs one queued experiment with a shared client
+        and a kernel from the configured executor backend.
+        """
+        scheduler = get_scheduler()
+        db = self.session_factory()
+        experiment = None
+        try:
+            experiment = db.query(Experiment).get(experiment_id)
+            if experiment is None or experiment.deleted_at or experiment.status != 'pending':
+                return
+            ai_client = scheduler.client_for(experiment.ai_client, experiment.model)
+            executor = get_backend().acquire()
+        except Exception as e:
+            logger.error(f"Error starting queued experiment {experiment_id}: {str(e)}")
+            if experiment is not None:
+                set_status(db, experiment, 'failed')
+                db.commit()
+            db.close()
+            return
+        db.close()
+        self._run_in_thread(experiment_id, ai_client, executor)
+
+    @staticmethod
+    def _escalation_client():
+        """
+        Client the loop switches to when it stagnates, from ESCALATION_MODEL
+        ("client:model"). Returns None when unset or unavailable.
+        """
+        spec = os.getenv("ESCALATION_MODEL")
+        if not spec or ":" not in spec:
+            return None
+        name, model = spec.split(":", 1)
+        try:
+            return get_scheduler().client_for(name, model)
+        except Exception as e:
+            logger.error(f"Escalation model {spec} unavailable: {str(e)}")
+            return None
+
     def _run_in_thread(self, experiment_id: str, ai_client, executor):
         """
         Runs the experiment in a separate thread with a new DB session.
         """
         db = self.session_factory()
         try:
+            state = load_state(db, experiment_id)
+            token = cancellation.register(
+                experiment_id,
+                deadline_at=loop_deadline(db, state, cancellation.DEADLINE_SECONDS),
+                tokens_used=state.tokens_used or 0,
+            )
             experiment = db.query(Experiment).get(experiment_id)
             conversation = Conversation(db, experiment_id)
             run_feedback_loop(
@@ -70,10 +172,15 @@ class ExperimentManager:
                 conversation=conversation,
                 ai_client=ai_client,
                 executor=executor,
-                notifier=lambda subject, body, to_email, smtp_cfg: print(subject, body)
+                notifier=lambda subject, body, to_email, smtp_cfg: print(subject, body),
+                escalation_client=self._escalation_client(),
+                validator=CodeValidator(executor) if os.getenv("VALIDATION_ENABLED", "true").lower() == "true" else None,
+                token=token,
+                on_output=lambda text: ws_manager.publish(experiment_id, {"event": "output", "text": text})
             )
         except Exception as e:
             logger.error(f"Error in thread for experiment {experiment_id}: {str(e)}")
         finally:
+            cancellation.unregister(experiment_id)
             db.close()
             executor.shutdown()
\ No newline at end of file
@@ -0,0 +1,200 @@
+"""
+Streaming export of experiments and conversations.
+
+Rows are read with server-side cursors (`yield_per`) and written as they
+arrive, so memory stays constant regardless of database size; archived
+conversations are decompressed one experiment at a time.
+
+CLI usage:
+    python export.py --format jsonl --out runs.jsonl --since 2024-01-01 --status success,failed
+    python export.py --format parquet --out runs/   # writes experiments.parquet and messages.parquet
+"""
+import os
+import json
+import logging
+import argparse
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+from archive import unpack
+from models import ArchivedConversation, Experiment, Message
+
+logger = logging.getLogger(__name__)
+
+YIELD_PER = 500
+PARQUET_ROW_GROUP = 5000
+
+@dataclass
+class ExportFilter:
+    """
+    Time/status filter shared by the HTTP endpoint and the CLI.
+    """
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    statuses: List[str] = field(default_factory=list)
+
+    def apply(self, query):
+        query = query.filter(Experiment.deleted_at.is_(None))
+        if self.since:
+            query = query.filter(Experiment.created_at >= self.since)
+        if self.until:
+            query = query.filter(Experiment.created_at < self.until)
+        if self.statuses:
+            query = query.filter(Experiment.status.in_(self.statuses))
+        return query
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+def iter_experiments(db, flt: ExportFilter) -> Iterator[dict]:
+    """
+    Yields one record per experiment matching the filter.
+    """
+    query = flt.apply(db.query(Experiment)).order_by(Experiment.created_at.asc()).yield_per(YIELD_PER)
+    for e in query:
+        yield {
+            "id": e.id,
+            "prompt": e.prompt,
+            "ai_client": e.ai_client,
+            "model": e.model,
+            "status": e.status,
+            "batch_id": e.batch_id,
+            "created_at": e.created_at,
+            "finished_at": e.finished_at,
+        }
+
+def iter_messages(db, flt: ExportFilter) -> Iterator[dict]:
+    """
+    Yields one record per message of the matching experiments, live rows
+    first and then archived conversations.
+    """
+    live = (
+        flt.apply(db.query(Message).join(Experiment, Experiment.id == Message.experiment_id))
+        .order_by(Message.experiment_id.asc(), Message.timestamp.asc())
+        .yield_per(YIELD_PER)
+    )
+    for m in live:
+        yield {
+            "experiment_id": m.experiment_id,
+            "message_id": m.id,
+            "sender": m.sender,
+            "content": m.content,
+            "timestamp": m.timestamp,
+        }
+
+    archived = (
+        flt.apply(db.query(ArchivedConversation).join(Experiment, Experiment.id == ArchivedConversation.experiment_id))
+        .order_by(ArchivedConversation.experiment_id.asc())
+        .yield_per(1)
+    )
+    for archive in archived:
+        for m in unpack(archive):
+            yield {
+                "experiment_id": archive.experiment_id,
+                "message_id": m.id,
+                "sender": m.sender,
+                "content": m.content,
+                "timestamp": m.timestamp,
+            }
+
+def iter_jsonl(db, flt: ExportFilter, include_messages: bool = True) -> Iterator[str]:
+    """
+    Yields JSONL lines tagged with a "type" of experiment or message.
+    """
+    for record in iter_experiments(db, flt):
+        yield json.dumps({"type": "experiment", **record}, ensure_ascii=False, default=_json_default) + "\n"
+    if include_messages:
+        for record in iter_messages(db, flt):
+            yield json.dumps({"type": "message", **record}, ensure_ascii=False, default=_json_default) + "\n"
+
+def _parquet_schema(table: str):
+    import pyarrow as pa
+
+    if table == "experiments":
+        return pa.schema([
+            ("id", pa.string()), ("prompt", pa.string()), ("ai_client", pa.string()),
+            ("model", pa.string()), ("status", pa.string()), ("batch_id", pa.string()),
+            ("created_at", pa.timestamp("us")), ("finished_at", pa.timestamp("us")),
+        ])
+    return pa.schema([
+        ("experiment_id", pa.string()), ("message_id", pa.int64()), ("sender", pa.string()),
+        ("content", pa.string()), ("timestamp", pa.timestamp("us")),
+    ])
+
+def write_parquet(records: Iterator[dict], table: str, sink) -> int:
+    """
+    Writes records to a Parquet file (path or binary file object) in row
+    groups of PARQUET_ROW_GROUP rows. Returns the number of rows written.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError(f"Parquet export requires pyarrow: pip install pyarrow ({str(e)})")
+
+    schema = _parquet_schema(table)
+    written = 0
+    chunk = []
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= PARQUET_ROW_GROUP:
+                writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+                written += len(chunk)
+                chunk = []
+        if chunk or not written:
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            written += len(chunk)
+    return written
+
+def parse_filter(since: Optional[str], until: Optional[str], status: Optional[str]) -> ExportFilter:
+    """
+    Builds an ExportFilter from ISO timestamps and a comma-separated status list.
+    """
+    return ExportFilter(
+        since=datetime.fromisoformat(since) if since else None,
+        until=datetime.fromisoformat(until) if until else None,
+        statuses=[s.strip() for s in status.split(",") if s.strip()] if status else [],
+    )
+
+def main():
+    from db import SessionLocal
+    from logging_config import configure_logging
+
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Export experiments and conversations")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--out", required=True, help="Output file (jsonl) or directory (parquet)")
+    parser.add_argument("--since", help="ISO timestamp, inclusive")
+    parser.add_argument("--until", help="ISO timestamp, exclusive")
+    parser.add_argument("--status", help="Comma-separated statuses, e.g. success,failed")
+    parser.add_argument("--no-messages", action="store_true", help="Export experiments only")
+    args = parser.parse_args()
+
+    flt = parse_filter(args.since, args.until, args.status)
+    db = SessionLocal()
+    try:
+        if args.format == "jsonl":
+            lines = 0
+            with open(args.out, "w", encoding="utf-8") as fh:
+                for line in iter_jsonl(db, flt, include_messages=not args.no_messages):
+                    fh.write(line)
+                    lines += 1
+            logger.info(f"Wrote {lines} records to {args.out}")
+        else:
+            os.makedirs(args.out, exist_ok=True)
+            path = os.path.join(args.out, "experiments.parquet")
+            rows = write_parquet(iter_experiments(db, flt), "experiments", path)
+            logger.info(f"Wrote {rows} experiments to {path}")
+            if not args.no_messages:
+                path = os.path.join(args.out, "messages.parquet")
+                rows = write_parquet(iter_messages(db, flt), "messages", path)
+                logger.info(f"Wrote {rows} messages to {path}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,17 @@
 import time
 import logging
-from typing import Callable
+from typing import Callable, Optional
 
 from models import Message
 from sqlalchemy.sql import func
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+from archive import TERMINAL_STATUSES
+from cancellation import CancellationToken, Cancelled
+from convergence import ESCALATE, STOP, StagnationDetector, classify, code_fingerprint
+from loop_state import executed_cells, load_state, record_iteration, record_response, replay
+from metrics import metrics
+from stats import observe_latency, set_status
+
 logger = logging.getLogger(__name__)
 
 def run_feedback_loop(
@@ -16,49 +21,111 @@ def run_feedback_loop(
     ai_client,
     executor,
     notifier: Callable,
-    max_iterations: int = 10
+    max_iterations: int = 10,
+    escalation_client=None,
+    validator=None,
+    token: Optional[CancellationToken] = None,
+    on_output: Optional[Callable[[str], None]] = None
 ):
     """
     Core feedback loop for iterative AI code generation and execution.
+    Stops early, or escalates to `escalation_client` if given, when the
+    model keeps returning the same code or hitting the same error.
+    Candidates rejected by `validator` are returned to the model without
+    being executed. `token` is checked between phases and aborts the LLM
+    call or interrupts the kernel cell in flight when cancelled.
+    `on_output` receives kernel output as it streams, before the cell ends.
     """
-    experiment.status = 'running'
+    token = token or CancellationToken(experiment.id)
+    set_status(db, experiment, 'running')
     _safe_commit(db)
+    if experiment.status in TERMINAL_STATUSES:
+        logger.info(f"Experiment {experiment.id} is already {experiment.status}; not running it")
+        return  # The caller shuts the executor down
+    detector = StagnationDetector()
+    state = load_state(db, experiment.id)
 
     try:
-        for iteration in range(max_iterations):
-            # Fetch conversation history
-            messages = [
-                {"sender": msg.sender, "content": msg.content}
-                for msg in db.query(Message)
-                .filter(Message.experiment_id == experiment.id)
-                .order_by(Message.timestamp.asc())
-                .all()
-            ]
-
-            if iteration == 0 and not messages:
-                messages.append({"sender": "user", "content": experiment.prompt})
-
-            # Query AI with history
-            original, code, text = ai_client.query(messages)
-            conversation.append("system", original)
+        # Resuming after a restart: rebuild the kernel and remember what was tried
+        if state.needs_replay:
+            token.check()
+            replay(db, state, executor)
+        detector.seen_code.update(code_fingerprint(cell) for cell in executed_cells(state))
+        if state.iteration:
+            logger.info(f"Resuming experiment {experiment.id} at iteration {state.iteration}")
+
+        for iteration in range(state.iteration, max_iterations):
+            token.check()
+            started = time.monotonic()
+            if state.pending_code is not None:
+                # The LLM already answered before the restart; run that answer
+                code, text = state.pending_code, ""
+            else:
+                code, text = _query(db, experiment, conversation, ai_client, state, token)
 
             # Execute code if present
-            execution_result = None
+            result = None
+            executed = False
             if code:
-                execution_result = executor.execute(code)
+                validation = validator.validate(code) if validator is not None else None
+                if validation is not None and not validation.ok:
+                    # Send the structured error straight back without a kernel round trip
+                    result = validation.as_execution_result()
+                    if not validation.kernel_executions:
+                        metrics.incr("validation.kernel_executions_saved")
+                    metrics.incr(f"validation.rejected.{validation.kind}")
+                    header = "---- Validation Result (code was not executed) ----"
+                else:
+                    token.check()
+                    interrupt = getattr(executor, "interrupt", None)
+                    remove = token.on_cancel(interrupt) if interrupt else (lambda: None)
+                    try:
+                        result = executor.execute_structured(code, on_output=on_output)
+                    finally:
+                        remove()
+                    executed = True
+                    if validator is not None:
+                        validator.executed(code)
+                    header = "---- Jupyter Result ----"
                 execution_result = "\n".join([
                     "Evaluate the below Jupyter result from the provided code",
                     "If it addresses the problem, return a summary message without code",
-                    "---- Jupyter Result ----",
-                    execution_result
+                    header,
+                    result.render()
                 ])
                 conversation.append("assistant", execution_result or text)
 
-            _safe_commit(db)
+            observe_latency(db, "iteration", time.monotonic() - started)
+            record_iteration(db, state, iteration, code, result.render() if result else None, executed)
+            token.check()
 
             # Check for success
-            if not execution_result or "Error" not in execution_result:
-                experiment.status = 'success'
+            outcome = classify(result)
+            if outcome in ("success", "no_code"):
+                set_status(db, experiment, 'success', iterations=state.iteration)
+                _safe_commit(db)
+                break
+
+            # Stop or change strategy when the loop is going in circles
+            verdict = detector.observe(code, result)
+            if verdict == ESCALATE:
+                logger.info(f"Escalating experiment {experiment.id}: {detector.reason}")
+                metrics.incr("loop.escalations")
+                # Its own sender keeps the nudge apart from real user input in storage, search and export
+                conversation.append("nudge", "\n".join([
+                    f"Your recent attempts are not making progress ({detector.reason}).",
+                    "Do not repeat earlier code. Rethink the approach from scratch and try a different strategy.",
+                ]))
+                if escalation_client is not None:
+                    ai_client = escalation_client
+                    conversation.append("system", f"Escalated to model {escalation_client.model}")
+            elif verdict == STOP:
+                saved = max_iterations - (iteration + 1)
+                logger.info(f"Stopping experiment {experiment.id} early: {detector.reason}; saved {saved} iterations")
+                metrics.incr("loop.stagnation_stops")
+                metrics.incr("loop.iterations_saved", saved)
+                conversation.append("system", f"Stopped early: {detector.reason}")
+                set_status(db, experiment, 'failed')
                 _safe_commit(db)
                 break
 
@@ -71,15 +138,19 @@ def run_feedback_loop(
             if new_messages:
                 logger.info(f"Found {len(new_messages)} new user inputs for experiment {experiment.id}")
 
-            time.sleep(1)
+            token.wait(1)
         else:
-            experiment.status = 'failed'
+            set_status(db, experiment, 'failed')
             _safe_commit(db)
 
+    except Cancelled as c:
+        metrics.incr("loop.cancelled")
+        _finish_cancelled(db, experiment, conversation, token, c.reason)
+
     except Exception as e:
         logger.exception(f"Exception in feedback loop for experiment {experiment.id}")
         conversation.append("system", f"Exception in feedback loop: {str(e)}")
-        experiment.status = 'failed'
+        set_status(db, experiment, 'failed')
         _safe_commit(db, rollback_on_fail=True)
 
     finally:
@@ -93,6 +164,51 @@ def run_feedback_loop(
         body = f"Final status: {experiment.status}\n\nConversation history:\n{full_convo}"
         notifier(subject=subject, body=body, to_email="user@example.com", smtp_cfg={})
 
+def _finish_cancelled(db, experiment, conversation, token, reason: str):
+    """
+    Records why the loop stopped. A user stop leaves the experiment stopped;
+    a deadline or budget cancellation fails it.
+    """
+    logger.info(f"Experiment {experiment.id} cancelled: {reason}")
+    try:
+        db.refresh(experiment)  # A stop may have been committed by another session
+    except Exception:
+        db.rollback()
+        return  # Already purged
+    if experiment.deleted_at is None:
+        conversation.append("system", f"Cancelled: {reason}")
+    if experiment.status not in TERMINAL_STATUSES:
+        set_status(db, experiment, 'stopped' if token.user_requested else 'failed')
+    _safe_commit(db)
+
+def _query(db, experiment, conversation, ai_client, state, token):
+    """
+    Asks the model for the next step and persists its answer before it runs.
+    Returns: (code, text)
+    """
+    # Fetch conversation history
+    messages = [
+        {"sender": msg.sender, "content": msg.content}
+        for msg in db.query(Message)
+        .filter(Message.experiment_id == experiment.id)
+        .order_by(Message.timestamp.asc())
+        .all()
+    ]
+
+    # The prompt is not stored as a message; keep it in front of every query
+    messages.insert(0, {"sender": "user", "content": experiment.prompt})
+
+    # Query AI with history
+    started = time.monotonic()
+    original, code, text = token.run(ai_client.query, messages, cancelled=lambda: token.cancelled)
+    observe_latency(db, "llm", time.monotonic() - started)
+    # Rough usage (~4 chars per token) charged against the experiment's budget
+    token.spend((sum(len(m["content"]) for m in messages) + len(original)) // 4)
+    state.tokens_used = token.tokens_used  # Committed with the response below
+    conversation.append("system", original)
+    record_response(db, state, code)
+    return code, text
+
 def _safe_commit(db, rollback_on_fail: bool = True):
     """
     Safely commits database transactions with rollback on failure.
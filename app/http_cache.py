@@ -0,0 +1,156 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+
+from metrics import metrics
+
+# Experiments in these states never change again (deletion aside)
+IMMUTABLE_STATUSES = ("success", "failed")
+
+@dataclass
+class CachedPayload:
+    body: bytes
+    media_type: str
+    etag: str
+    last_modified: Optional[datetime]
+
+class PayloadCache:
+    """
+    In-process LRU of rendered/serialised payloads, bounded by entry count
+    and total size. Keys are (kind, experiment_id).
+    """
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], CachedPayload]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, experiment_id: str) -> Optional[CachedPayload]:
+        with self._lock:
+            payload = self._entries.get((kind, experiment_id))
+            if payload is not None:
+                self._entries.move_to_end((kind, experiment_id))
+            return payload
+
+    def put(self, kind: str, experiment_id: str, payload: CachedPayload) -> None:
+        if len(payload.body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop((kind, experiment_id), None)
+            if previous is not None:
+                self._size -= len(previous.body)
+            self._entries[(kind, experiment_id)] = payload
+            self._size += len(payload.body)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+
+    def invalidate(self, experiment_id: str) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == experiment_id]:
+                self._size -= len(self._entries.pop(key).body)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size}
+
+response_cache = PayloadCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_ENTRIES", "256")),
+    max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+)
+
+def is_immutable(experiment) -> bool:
+    return experiment.status in IMMUTABLE_STATUSES and experiment.deleted_at is None
+
+def _to_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)  # Stored as naive UTC
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+def immutable_etag(kind: str, experiment) -> str:
+    """
+    Validator for a finished experiment, computed without loading its messages.
+    """
+    seed = f"{kind}:{experiment.id}:{experiment.status}:{experiment.finished_at}"
+    return f'"{hashlib.sha1(seed.encode("utf-8")).hexdigest()}"'
+
+def make_payload(body: bytes, media_type: str, last_modified: Optional[datetime], etag: Optional[str] = None) -> CachedPayload:
+    """
+    Wraps a rendered body; without an explicit etag one is derived from the content.
+    """
+    etag = etag or f'"{hashlib.sha1(body).hexdigest()}"'
+    return CachedPayload(body=body, media_type=media_type, etag=etag, last_modified=_to_utc(last_modified))
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """
+    Evaluates If-None-Match (preferred) or If-Modified-Since.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    last_modified = _to_utc(last_modified)
+    if if_modified_since and last_modified is not None:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def validator_headers(etag: str, last_modified: Optional[datetime]) -> Dict[str, str]:
+    # no-cache: browsers may store the page but must revalidate each time
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    last_modified = _to_utc(last_modified)
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return headers
+
+def conditional_response(request: Request, payload: CachedPayload) -> Response:
+    """
+    304 when the client's copy is current, otherwise the full payload.
+    """
+    headers = validator_headers(payload.etag, payload.last_modified)
+    if not_modified(request, payload.etag, payload.last_modified):
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload.body, media_type=payload.media_type, headers=headers)
+
+def serve_experiment_payload(
+    request: Request,
+    kind: str,
+    experiment,
+    render: Callable[[], Tuple[bytes, str, Optional[datetime]]],
+) -> Response:
+    """
+    Serves one view of an experiment with ETag/Last-Modified validators.
+    `render` returns (body, media_type, last_modified). Finished experiments
+    are answered with 304 or from the cache without loading their messages.
+    """
+    if not is_immutable(experiment):
+        body, media_type, last_modified = render()
+        return conditional_response(request, make_payload(body, media_type, last_modified))
+
+    etag = immutable_etag(kind, experiment)
+    last_modified = experiment.finished_at or experiment.created_at
+    if not_modified(request, etag, last_modified):
+        metrics.incr("http_cache.not_modified")
+        return Response(status_code=304, headers=validator_headers(etag, last_modified))
+    payload = response_cache.get(kind, experiment.id)
+    if payload is None or payload.etag != etag:
+        metrics.incr("http_cache.misses")
+        body, media_type, _ = render()
+        payload = make_payload(body, media_type, last_modified, etag)
+        response_cache.put(kind, experiment.id, payload)
+    else:
+        metrics.incr("http_cache.hits")
+    return conditional_response(request, payload)
@@ -0,0 +1,13 @@
+import logging
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """
+    Configures root logging once per process.
+    Library modules only create named loggers; entry points call this.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    logging.basicConfig(level=level, format=LOG_FORMAT)
@@ -0,0 +1,214 @@
+import os
+import json
+import socket
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from cancellation import cancel_stopped
+from maintenance import PeriodicJob
+from models import Experiment, LoopState
+from stats import move_status
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = float(os.getenv("LOOP_HEARTBEAT_INTERVAL", "15"))
+HEARTBEAT_TIMEOUT = float(os.getenv("LOOP_HEARTBEAT_TIMEOUT", "60"))
+ACTIVE_STATUSES = ("pending", "running")
+
+_owner = None
+
+def process_owner_id() -> str:
+    """
+    Identifies this process as the driver of its loops. Computed after fork,
+    so gunicorn workers sharing a preloaded app get distinct ids.
+    """
+    global _owner
+    if _owner is None or _owner[0] != os.getpid():
+        _owner = (os.getpid(), f"{socket.gethostname()}:{os.getpid()}:{os.urandom(4).hex()}")
+    return _owner[1]
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def claim_new(db, experiment_id: str) -> LoopState:
+    """
+    Creates the state row for a freshly queued experiment, owned by this process.
+    The caller owns the transaction.
+    """
+    state = LoopState(experiment_id=experiment_id, owner=process_owner_id(), heartbeat_at=_utcnow())
+    db.add(state)
+    return state
+
+def load_state(db, experiment_id: str) -> LoopState:
+    """
+    Returns the experiment's state row, creating it for experiments queued
+    before durable state existed.
+    """
+    state = db.query(LoopState).get(experiment_id)
+    if state is None:
+        state = claim_new(db, experiment_id)
+        db.commit()
+    return state
+
+def loop_deadline(db, state: LoopState, seconds: float) -> Optional[datetime]:
+    """
+    The experiment's absolute deadline, fixed on its first run so resuming
+    after a restart does not grant a fresh time allowance. None when disabled.
+    """
+    if state.deadline_at is None and seconds:
+        state.deadline_at = _utcnow() + timedelta(seconds=seconds)
+        db.commit()
+    return state.deadline_at
+
+def executed_cells(state: LoopState) -> List[str]:
+    return json.loads(state.cells or "[]")
+
+def record_response(db, state: LoopState, code: Optional[str]) -> None:
+    """
+    Persists the LLM's answer before running it, so a restart re-runs the
+    code instead of paying for the same LLM call again.
+    """
+    state.pending_code = code
+    state.heartbeat_at = _utcnow()
+    db.commit()
+
+def record_iteration(db, state: LoopState, iteration: int, code: Optional[str], result: Optional[str], executed: bool) -> None:
+    """
+    Persists a completed iteration. `executed` is False when the code never
+    reached the kernel (e.g. rejected by validation) and so needs no replay.
+    """
+    if executed and code:
+        state.cells = json.dumps(executed_cells(state) + [code])
+    state.iteration = iteration + 1
+    state.last_code = code
+    state.last_result = result
+    state.pending_code = None
+    state.heartbeat_at = _utcnow()
+    db.commit()
+
+def replay(db, state: LoopState, executor) -> None:
+    """
+    Rebuilds kernel state on a fresh kernel by re-running the cells the
+    previous kernel executed. Errors are expected (those cells failed the
+    first time too) and ignored.
+    """
+    cells = executed_cells(state)
+    logger.info(f"Replaying {len(cells)} cells for experiment {state.experiment_id}")
+    for code in cells:
+        result = executor.execute_structured(code)
+        if not result.ok:
+            logger.debug(f"Replay cell raised {result.ename}: {result.evalue}")
+    state.needs_replay = False
+    db.commit()
+
+def heartbeat(session_factory: Callable) -> int:
+    """
+    Marks every active loop driven by this process as alive.
+    """
+    db = session_factory()
+    try:
+        active = db.query(Experiment.id).filter(Experiment.status.in_(ACTIVE_STATUSES))
+        updated = (
+            db.query(LoopState)
+            .filter(LoopState.owner == process_owner_id(), LoopState.experiment_id.in_(active.scalar_subquery()))
+            .update({LoopState.heartbeat_at: _utcnow()}, synchronize_session=False)
+        )
+        db.commit()
+        return updated
+    finally:
+        db.close()
+
+def recover_orphans(session_factory: Callable, resume: Callable[[str], None]) -> List[str]:
+    """
+    Claims pending/running experiments whose driving process stopped
+    heartbeating and hands them to `resume`. Claims are conditional
+    updates, so concurrent workers never resume the same experiment twice.
+    """
+    me = process_owner_id()
+    cutoff = _utcnow() - timedelta(seconds=HEARTBEAT_TIMEOUT)
+    claimed = []
+    db = session_factory()
+    try:
+        rows = (
+            db.query(Experiment.id, Experiment.status, LoopState.experiment_id.label("state_id"), LoopState.owner, LoopState.cells)
+            .outerjoin(LoopState, LoopState.experiment_id == Experiment.id)
+            .filter(
+                Experiment.status.in_(ACTIVE_STATUSES),
+                Experiment.deleted_at.is_(None),
+                or_(
+                    LoopState.heartbeat_at < cutoff,
+                    (LoopState.experiment_id.is_(None)) & (Experiment.created_at < cutoff),
+                ),
+            )
+            .all()
+        )
+        for row in rows:
+            if row.state_id is None:
+                try:
+                    claim_new(db, row.id)
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+                    continue
+            else:
+                won = (
+                    db.query(LoopState)
+                    .filter(
+                        LoopState.experiment_id == row.id,
+                        LoopState.owner.is_(None) if row.owner is None else LoopState.owner == row.owner,
+                        LoopState.heartbeat_at < cutoff,
+                    )
+                    .update({
+                        LoopState.owner: me,
+                        LoopState.heartbeat_at: _utcnow(),
+                        LoopState.needs_replay: bool(json.loads(row.cells or "[]")),
+                    }, synchronize_session=False)
+                )
+                db.commit()
+                if not won:
+                    continue
+            if db.query(Experiment).filter(Experiment.id == row.id, Experiment.status == row.status).update(
+                {Experiment.status: "pending"}, synchronize_session=False
+            ):
+                move_status(db, row.status, "pending")
+            db.commit()
+            claimed.append(row.id)
+    finally:
+        db.close()
+
+    for experiment_id in claimed:
+        logger.info(f"Recovered orphaned experiment {experiment_id}")
+        resume(experiment_id)
+    return claimed
+
+class LoopSupervisor:
+    """
+    Keeps this process's loops heartbeating, cancels those stopped through
+    another process, and periodically adopts loops orphaned by processes
+    that died (deploys, crashes).
+    """
+    def __init__(self, session_factory: Callable, resume: Callable[[str], None]):
+        self.session_factory = session_factory
+        self.resume = resume
+        self._heartbeat = PeriodicJob("loop-heartbeat", HEARTBEAT_INTERVAL, self.beat)
+        self._recovery = PeriodicJob("loop-recovery", HEARTBEAT_TIMEOUT / 2, self.recover)
+
+    def beat(self):
+        heartbeat(self.session_factory)
+        cancel_stopped(self.session_factory)
+
+    def recover(self) -> List[str]:
+        return recover_orphans(self.session_factory, self.resume)
+
+    def start(self):
+        self.recover()
+        self._heartbeat.start()
+        self._recovery.start()
+
+    def stop(self):
+        self._heartbeat.stop()
+        self._recovery.stop()
@@ -1,71 +1,88 @@
-from fastapi import FastAPI, Request, Form, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, FastAPI, Request, Form, HTTPException, Depends, WebSocket
 from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
 from typing import List, Dict
 import asyncio
+import hmac
 import json
 import logging
+import os
+import tempfile
 from datetime import datetime, timedelta
 
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import func
+
+import cancellation
+from archive import TERMINAL_STATUSES, load_messages
+from conversation import Conversation
+from http_cache import response_cache, serve_experiment_payload
+from executor_backends import WORKER_TOKEN_HEADER, check_backend_config, record_heartbeat, shutdown_backend
 from experiment_manager import ExperimentManager
-from models import Experiment, Message
-from db import SessionLocal, get_session
+from export import iter_experiments, iter_jsonl, iter_messages, parse_filter, write_parquet
+from loop_state import LoopSupervisor
+from maintenance import RetentionJob
+from metrics import metrics
+from models import Batch, Experiment, Message, Worker
+from db import SessionLocal, get_session, init_db
+from logging_config import configure_logging
+from scheduler import shutdown_scheduler
+from search import search_messages
+from stats import get_stats, set_status
+from websocket_manager import manager as ws_manager
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
-templates = Jinja2Templates(directory="templates")
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "5000"))
+SIDEBAR_LIMIT = int(os.getenv("SIDEBAR_LIMIT", "50"))
+
+router = APIRouter()
+templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
 
-# WebSocket connections
-active_connections: Dict[str, List[WebSocket]] = {}
+def _message_event(message) -> dict:
+    return {
+        "event": "new_message",
+        "message": {
+            "sender": message.sender,
+            "content": message.content,
+            "timestamp": message.timestamp.isoformat()
+        }
+    }
 
-@app.websocket("/ws/{experiment_id}")
+@router.websocket("/ws/{experiment_id}")
 async def websocket_endpoint(websocket: WebSocket, experiment_id: str):
     await websocket.accept()
-    if experiment_id not in active_connections:
-        active_connections[experiment_id] = []
-    active_connections[experiment_id].append(websocket)
+    connection = ws_manager.register(experiment_id, websocket)
     
     # Create a single session for the WebSocket connection
     db = SessionLocal()
     try:
         # Send initial experiment data
         experiment = db.query(Experiment).get(experiment_id)
-        if not experiment:
-            await websocket.send_json({"event": "deleted"})
+        if not experiment or experiment.deleted_at:
+            await ws_manager.send(connection, {"event": "deleted"})
             return
         
         last_timestamp = datetime.utcnow() - timedelta(days=1)  # Start with a wide range
         last_status = experiment.status
         
-        # Send initial messages
-        messages = (
-            db.query(Message)
-            .filter(Message.experiment_id == experiment_id)
-            .order_by(Message.timestamp.asc())
-            .all()
-        )
+        # Send initial messages (finished experiments may be served from the archive)
+        messages = load_messages(db, experiment_id)
         if messages:
             last_timestamp = messages[-1].timestamp
             for message in messages:
-                await websocket.send_json({
-                    "event": "new_message",
-                    "message": {
-                        "sender": message.sender,
-                        "content": message.content,
-                        "timestamp": message.timestamp.isoformat()
-                    }
-                })
+                await ws_manager.send(connection, _message_event(message))
             logger.info(f"Sent {len(messages)} initial messages for experiment {experiment_id}")
         
-        while True:
+        # The writer task marks the connection closed when the client goes away
+        while not connection.closed:
             experiment = db.query(Experiment).get(experiment_id)
-            if not experiment:
-                await websocket.send_json({"event": "deleted"})
+            if not experiment or experiment.deleted_at:
+                await ws_manager.send(connection, {"event": "deleted"})
                 break
             
             # Check for new messages
@@ -78,20 +95,13 @@ async def websocket_endpoint(websocket: WebSocket, experiment_id: str):
             if messages:
                 last_timestamp = messages[-1].timestamp
                 for message in messages:
-                    await websocket.send_json({
-                        "event": "new_message",
-                        "message": {
-                            "sender": message.sender,
-                            "content": message.content,
-                            "timestamp": message.timestamp.isoformat()
-                        }
-                    })
+                    await ws_manager.send(connection, _message_event(message))
                 logger.info(f"Sent {len(messages)} new messages for experiment {experiment_id}")
             
             # Check for status change
             if experiment.status != last_status:
                 last_status = experiment.status
-                await websocket.send_json({
+                await ws_manager.send(connection, {
                     "event": "status_update",
                     "experiment": {
                         "id": experiment.id,
@@ -104,26 +114,29 @@ async def websocket_endpoint(websocket: WebSocket, experiment_id: str):
             
             db.commit()  # Ensure session is fresh
             await asyncio.sleep(1)  # Reduced to 1 second for faster updates
-    except WebSocketDisconnect:
         logger.info(f"WebSocket disconnected for experiment {experiment_id}")
     except Exception as e:
         logger.error(f"WebSocket error for experiment {experiment_id}: {str(e)}")
     finally:
         db.close()
-        if experiment_id in active_connections and websocket in active_connections[experiment_id]:
-            active_connections[experiment_id].remove(websocket)
-            if not active_connections[experiment_id]:
-                del active_connections[experiment_id]
+        await ws_manager.unregister(connection)
 
-@app.get("/")
+@router.get("/")
 async def index(request: Request, db: Session = Depends(get_session)):
-    experiments = db.query(Experiment).order_by(Experiment.created_at.desc()).all()
+    # Most recent experiments only; totals come from /api/stats
+    experiments = (
+        db.query(Experiment.id, Experiment.status)
+        .filter(Experiment.deleted_at.is_(None))
+        .order_by(Experiment.created_at.desc())
+        .limit(SIDEBAR_LIMIT)
+        .all()
+    )
     return templates.TemplateResponse(
         "index.html",
         {"request": request, "experiments": experiments}
     )
 
-@app.post("/start")
+@router.post("/start")
 async def start(
     request: Request,
     prompt: str = Form(...),
@@ -144,78 +157,446 @@ async def start(
         logger.error(f"Error starting experiment: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to start experiment")
 
-@app.get("/progress/{experiment_id}")
+def _last_modified(experiment, messages) -> datetime:
+    """
+    Last-Modified for a live experiment view; the body-derived ETag also
+    covers status changes that add no message.
+    """
+    if messages and messages[-1].timestamp:
+        return messages[-1].timestamp
+    return experiment.finished_at or experiment.created_at
+
+@router.get("/progress/{experiment_id}")
 async def progress(experiment_id: str, request: Request, db: Session = Depends(get_session)):
     experiment = db.query(Experiment).get(experiment_id)
-    if not experiment:
+    if not experiment or experiment.deleted_at:
+        response_cache.invalidate(experiment_id)
         return RedirectResponse("/", status_code=303)
     
-    messages = (
-        db.query(Message)
-        .filter(Message.experiment_id == experiment_id)
-        .order_by(Message.timestamp.asc())
-        .all()
-    )
-    experiments = db.query(Experiment).order_by(Experiment.created_at.desc()).all()
-    return templates.TemplateResponse(
-        "progress.html",
-        {
-            "request": request,
-            "experiment": experiment,
-            "messages": messages,
-            "experiments": experiments
-        }
-    )
+    def render():
+        messages = load_messages(db, experiment_id)
+        response = templates.TemplateResponse(
+            "progress.html",
+            {
+                "request": request,
+                "experiment": experiment,
+                "messages": messages
+            }
+        )
+        return response.body, "text/html; charset=utf-8", _last_modified(experiment, messages)
+
+    return serve_experiment_payload(request, "progress", experiment, render)
+
+@router.get("/api/experiments/{experiment_id}")
+async def get_experiment(experiment_id: str, request: Request, db: Session = Depends(get_session)):
+    """
+    An experiment and its conversation as JSON, with conditional GET support.
+    """
+    experiment = db.query(Experiment).get(experiment_id)
+    if not experiment or experiment.deleted_at:
+        response_cache.invalidate(experiment_id)
+        raise HTTPException(status_code=404, detail="Experiment not found")
 
-@app.post("/progress/{experiment_id}/input")
+    def render():
+        messages = load_messages(db, experiment_id)
+        body = json.dumps({
+            "id": experiment.id,
+            "prompt": experiment.prompt,
+            "ai_client": experiment.ai_client,
+            "model": experiment.model,
+            "status": experiment.status,
+            "batch_id": experiment.batch_id,
+            "created_at": experiment.created_at.isoformat() if experiment.created_at else None,
+            "finished_at": experiment.finished_at.isoformat() if experiment.finished_at else None,
+            "messages": [
+                {
+                    "id": m.id,
+                    "sender": m.sender,
+                    "content": m.content,
+                    "timestamp": m.timestamp.isoformat() if m.timestamp else None,
+                }
+                for m in messages
+            ],
+        }).encode("utf-8")
+        return body, "application/json", _last_modified(experiment, messages)
+
+    return serve_experiment_payload(request, "json", experiment, render)
+
+@router.post("/progress/{experiment_id}/input")
 async def add_input(experiment_id: str, content: str = Form(...), db: Session = Depends(get_session)):
     experiment = db.query(Experiment).get(experiment_id)
-    if not experiment or experiment.status not in ["running", "pending"]:
+    if not experiment or experiment.deleted_at or experiment.status not in ["running", "pending"]:
         raise HTTPException(status_code=404, detail="Experiment not found or not active")
     
-    message = Message(
-        experiment_id=experiment_id,
-        sender="user",
-        content=content,
-        timestamp=datetime.utcnow()
-    )
-    db.add(message)
-    db.commit()
+    message = Conversation(db, experiment_id).append("user", content, timestamp=datetime.utcnow())
     
-    if experiment_id in active_connections:
-        for conn in active_connections[experiment_id]:
-            await conn.send_json({
-                "event": "new_message",
-                "message": {
-                    "sender": message.sender,
-                    "content": message.content,
-                    "timestamp": message.timestamp.isoformat()
-                }
-            })
-        logger.info(f"Notified {len(active_connections[experiment_id])} clients of new message for experiment {experiment_id}")
+    notified = ws_manager.broadcast(experiment_id, _message_event(message))
+    if notified:
+        logger.info(f"Notified {notified} clients of new message for experiment {experiment_id}")
     
     return {"status": "success"}
 
-@app.post("/delete/{experiment_id}")
+@router.post("/delete/{experiment_id}")
 async def delete_experiment(experiment_id: str, db: Session = Depends(get_session)):
     experiment = db.query(Experiment).get(experiment_id)
-    if not experiment:
+    if not experiment or experiment.deleted_at:
         return RedirectResponse("/", status_code=303)
     
-    experiment.status = "stopped"
-    db.commit()
-    
-    db.query(Message).filter(Message.experiment_id == experiment_id).delete()
-    db.delete(experiment)
+    # Soft delete; the retention job purges the rows in the background
+    set_status(db, experiment, "stopped")
+    experiment.deleted_at = func.now()
     db.commit()
+    response_cache.invalidate(experiment_id)
+    # Stop the loop now; loops in other processes notice within a heartbeat
+    cancellation.cancel(experiment_id)
     
-    if experiment_id in active_connections:
-        for conn in active_connections[experiment_id]:
-            await conn.send_json({"event": "deleted"})
-        logger.info(f"Notified {len(active_connections[experiment_id])} clients of deletion for experiment {experiment_id}")
+    notified = ws_manager.broadcast(experiment_id, {"event": "deleted"})
+    if notified:
+        logger.info(f"Notified {notified} clients of deletion for experiment {experiment_id}")
     
     return RedirectResponse("/", status_code=303)
 
+def _parse_models(values) -> List[tuple]:
+    """
+    Parses "client:model" specs, accepting a list or a comma-separated string.
+    """
+    if isinstance(values, str):
+        values = values.split(",")
+    if values is not None and not (isinstance(values, list) and all(isinstance(v, str) for v in values)):
+        raise HTTPException(status_code=400, detail="models must be a list of client:model strings")
+    models = []
+    for value in values or []:
+        value = value.strip()
+        if not value:
+            continue
+        if ":" not in value:
+            raise HTTPException(status_code=400, detail=f"Invalid model spec (expected client:model): {value}")
+        client, model = value.split(":", 1)
+        models.append((client, model))
+    if not models:
+        raise HTTPException(status_code=400, detail="At least one model is required")
+    return models
+
+def _parse_jsonl_prompts(raw: bytes) -> List[str]:
+    """
+    Parses an uploaded JSONL file; each line is a JSON string or {"prompt": ...}.
+    """
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Prompt file must be UTF-8 encoded JSONL")
+    prompts = []
+    for line_no, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON on line {line_no}: {str(e)}")
+        prompt = item.get("prompt") if isinstance(item, dict) else item
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise HTTPException(status_code=400, detail=f"Missing prompt on line {line_no}")
+        prompts.append(prompt)
+    return prompts
+
+async def _batch_events(batch_id: str, sse: bool, poll_interval: float = 1.0):
+    """
+    Yields one event per experiment as it reaches a terminal state, then a
+    summary. Each poll reads only (id, status) of the batch's finished items.
+    """
+    def encode(payload: dict) -> str:
+        data = json.dumps(payload)
+        return f"data: {data}\n\n" if sse else f"{data}\n"
+
+    db = SessionLocal()
+    try:
+        batch = db.query(Batch).get(batch_id)
+        reported = {}
+        while True:
+            # Counted before reading finished rows so nothing finishing in between is missed
+            unfinished = (
+                db.query(Experiment.id)
+                .filter(Experiment.batch_id == batch_id, Experiment.status.notin_(TERMINAL_STATUSES))
+                .count()
+            )
+            rows = (
+                db.query(Experiment.id, Experiment.status, Experiment.ai_client, Experiment.model)
+                .filter(Experiment.batch_id == batch_id, Experiment.status.in_(TERMINAL_STATUSES))
+                .all()
+            )
+            for row in rows:
+                if row.id in reported:
+                    continue
+                reported[row.id] = row.status
+                yield encode({
+                    "event": "item",
+                    "id": row.id,
+                    "status": row.status,
+                    "model": f"{row.ai_client}:{row.model}",
+                    "completed": len(reported),
+                    "total": batch.size,
+                })
+            if unfinished == 0:  # Purged items never report, so stop on what is left
+                break
+            db.commit()  # End the read transaction so the next poll sees new commits
+            await asyncio.sleep(poll_interval)
+
+        counts: Dict[str, int] = {}
+        for status in reported.values():
+            counts[status] = counts.get(status, 0) + 1
+        yield encode({"event": "done", "batch_id": batch_id, "total": batch.size, "counts": counts})
+    finally:
+        db.close()
+
+def _batch_stream(batch_id: str, request: Request) -> StreamingResponse:
+    sse = request.query_params.get("format") == "sse" or "text/event-stream" in request.headers.get("accept", "")
+    return StreamingResponse(
+        _batch_events(batch_id, sse),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+    )
+
+@router.post("/batches")
+async def create_batch(request: Request):
+    """
+    Submits a prompt x model grid.
+    JSON body: {"prompts": [...], "models": ["grok:grok-3", ...]}
+    Multipart form: file=<prompts.jsonl>, models="grok:grok-3,grok:grok-2"
+    Add ?stream=true to receive per-item completion events in the response.
+    """
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None:
+            raise HTTPException(status_code=400, detail="Missing JSONL file upload")
+        prompts = _parse_jsonl_prompts(await upload.read())
+        models = _parse_models(form.getlist("models") if len(form.getlist("models")) > 1 else form.get("models"))
+    else:
+        try:
+            payload = await request.json()
+        except ValueError:  # Malformed JSON or not UTF-8
+            raise HTTPException(status_code=400, detail="Request body must be JSON or multipart/form-data")
+        if not isinstance(payload, dict):
+            raise HTTPException(status_code=400, detail='JSON body must be an object: {"prompts": [...], "models": [...]}')
+        prompts = payload.get("prompts") or []
+        if not isinstance(prompts, list) or not all(isinstance(p, str) and p.strip() for p in prompts):
+            raise HTTPException(status_code=400, detail="prompts must be a list of non-empty strings")
+        models = _parse_models(payload.get("models"))
+
+    if not prompts:
+        raise HTTPException(status_code=400, detail="At least one prompt is required")
+    if len(prompts) * len(models) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_SIZE} experiments")
+
+    manager = ExperimentManager(SessionLocal)
+    try:
+        batch_id, experiment_ids = manager.start_batch(prompts, models)
+    except (ValueError, RuntimeError) as e:
+        logger.error(f"Error starting batch: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        manager.db.close()
+
+    if request.query_params.get("stream") == "true":
+        return _batch_stream(batch_id, request)
+    return JSONResponse(status_code=200, content={
+        "batch_id": batch_id,
+        "experiment_ids": experiment_ids,
+        "events": f"/batches/{batch_id}/events",
+    })
+
+@router.get("/batches/{batch_id}/events")
+async def batch_events(batch_id: str, request: Request, db: Session = Depends(get_session)):
+    if not db.query(Batch).get(batch_id):
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return _batch_stream(batch_id, request)
+
+@router.get("/api/search")
+async def search(
+    q: str,
+    sender: str = None,
+    status: str = None,
+    model: str = None,
+    raw: bool = False,
+    limit: int = 20,
+    offset: int = 0,
+    db: Session = Depends(get_session),
+):
+    """
+    Full-text search over conversation content, ranked best first.
+    `model` filters on the model name (e.g. grok-3); `raw=true` accepts the
+    backend's query syntax (FTS5 / websearch) instead of plain text.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+    try:
+        results = search_messages(
+            db, q, sender=sender, status=status, model=model, raw=raw,
+            limit=max(1, min(limit, 100)), offset=max(offset, 0),
+        )
+    except OperationalError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid search query: {str(e.orig)}")
+    return {"query": q, "results": results}
+
+@router.post("/workers/heartbeat")
+async def worker_heartbeat(request: Request, db: Session = Depends(get_session)):
+    """
+    Remote execution workers report capacity and load here (see worker.py).
+    Registration always requires WORKER_TOKEN: a registered URL is sent user code.
+    """
+    token = os.getenv("WORKER_TOKEN")
+    if not token:
+        raise HTTPException(status_code=403, detail="Worker registration is disabled; WORKER_TOKEN is not configured")
+    if not hmac.compare_digest(request.headers.get(WORKER_TOKEN_HEADER, ""), token):
+        raise HTTPException(status_code=401, detail="Invalid worker token")
+    payload = await request.json()
+    try:
+        record_heartbeat(
+            db,
+            url=payload["url"],
+            capacity=int(payload["capacity"]),
+            active=int(payload.get("active", 0)),
+            environment=payload.get("environment"),
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid heartbeat: {str(e)}")
+    return {"status": "ok"}
+
+@router.get("/workers")
+async def list_workers(db: Session = Depends(get_session)):
+    return [
+        {
+            "url": w.url,
+            "environment": w.environment,
+            "capacity": w.capacity,
+            "active": w.active,
+            "last_heartbeat": w.last_heartbeat.isoformat() if w.last_heartbeat else None,
+        }
+        for w in db.query(Worker).order_by(Worker.url).all()
+    ]
+
+@router.get("/api/stats")
+async def stats(db: Session = Depends(get_session)):
+    """
+    Dashboard aggregates maintained incrementally (see stats.py).
+    """
+    return get_stats(db)
+
+@router.get("/metrics")
+async def get_metrics():
+    return metrics.snapshot()
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class TemporaryFileResponse(FileResponse):
+    """
+    Sends a temporary file and deletes it afterwards, also when sending
+    fails (a BackgroundTask only runs after a successful send).
+    """
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            _remove_quietly(self.path)
+
+@router.get("/export")
+def export(
+    format: str = "jsonl",
+    table: str = "messages",
+    since: str = None,
+    until: str = None,
+    status: str = None,
+    messages: bool = True,
+):
+    """
+    Streams experiments (and their messages) matching a time/status filter.
+    format=jsonl streams records as they are read; format=parquet writes one
+    table (experiments or messages) to a temporary file and sends it.
+    """
+    try:
+        flt = parse_filter(since, until, status)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filter: {str(e)}")
+
+    if format == "jsonl":
+        def stream():
+            db = SessionLocal()
+            try:
+                yield from iter_jsonl(db, flt, include_messages=messages)
+            finally:
+                db.close()
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    if format == "parquet":
+        if table not in ("experiments", "messages"):
+            raise HTTPException(status_code=400, detail="table must be experiments or messages")
+        fd, path = tempfile.mkstemp(suffix=".parquet")
+        os.close(fd)
+        response = None
+        try:
+            db = SessionLocal()
+            try:
+                records = iter_experiments(db, flt) if table == "experiments" else iter_messages(db, flt)
+                write_parquet(records, table, path)
+            except RuntimeError as e:
+                raise HTTPException(status_code=501, detail=str(e))
+            finally:
+                db.close()
+            response = TemporaryFileResponse(
+                path,
+                media_type="application/vnd.apache.parquet",
+                filename=f"{table}.parquet",
+            )
+            return response
+        finally:
+            if response is None:
+                _remove_quietly(path)
+
+    raise HTTPException(status_code=400, detail="format must be jsonl or parquet")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Per-worker startup/shutdown hooks.
+    Schema creation runs here only when DB_AUTO_INIT is enabled; deployments
+    that run `python db.py` as a separate migration step can turn it off.
+    """
+    check_backend_config()
+    if os.getenv("DB_AUTO_INIT", "true").lower() == "true":
+        init_db()
+    retention = None
+    if os.getenv("RETENTION_ENABLED", "true").lower() == "true":
+        retention = RetentionJob(SessionLocal, interval=float(os.getenv("RETENTION_INTERVAL_SECONDS", "60")))
+        retention.start()
+    supervisor = None
+    if os.getenv("LOOP_RECOVERY_ENABLED", "true").lower() == "true":
+        recovery_manager = ExperimentManager(SessionLocal)
+        recovery_manager.db.close()  # Only resume() is used; queued runs open their own sessions
+        supervisor = LoopSupervisor(SessionLocal, recovery_manager.resume)
+        supervisor.start()
+    yield
+    if supervisor:
+        supervisor.stop()
+    if retention:
+        retention.stop()
+    shutdown_scheduler()
+    shutdown_backend()
+
+def create_app() -> FastAPI:
+    """
+    Application factory. Building the app performs no I/O, so it is safe
+    to call in the gunicorn master when running with --preload.
+    """
+    configure_logging()
+    application = FastAPI(lifespan=lifespan)
+    application.include_router(router)
+    return application
+
+app = create_app()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,173 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import or_, text
+
+from archive import TERMINAL_STATUSES, archive_experiment
+from db import engine, is_sqlite
+from models import ArchivedConversation, Experiment, LoopState, Message
+from search import unindex_experiment
+from stats import record_purged
+
+logger = logging.getLogger(__name__)
+
+class PeriodicJob(threading.Thread):
+    """
+    Daemon thread that runs a callable every `interval` seconds until stopped.
+    """
+    def __init__(self, name: str, interval: float, target: Callable[[], None]):
+        super().__init__(name=name, daemon=True)
+        self.interval = interval
+        self.target = target
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.target()
+            except Exception as e:
+                logger.error(f"Periodic job {self.name} failed: {str(e)}")
+
+    def stop(self):
+        self._stop_event.set()
+
+class RetentionPolicy:
+    """
+    Retention settings, read from the environment.
+      ARCHIVE_AFTER_SECONDS   compact finished experiments this long after they end (default 3600)
+      RETENTION_DAYS          purge finished experiments older than this; 0 keeps them forever (default 0)
+      VACUUM_INTERVAL_HOURS   hours between full VACUUMs on SQLite; 0 disables (default 24)
+      RETENTION_BATCH_SIZE    experiments handled per pass (default 100)
+    """
+    def __init__(self):
+        self.archive_after = timedelta(seconds=int(os.getenv("ARCHIVE_AFTER_SECONDS", "3600")))
+        retention_days = int(os.getenv("RETENTION_DAYS", "0"))
+        self.retention = timedelta(days=retention_days) if retention_days > 0 else None
+        self.vacuum_interval = float(os.getenv("VACUUM_INTERVAL_HOURS", "24")) * 3600
+        self.batch_size = int(os.getenv("RETENTION_BATCH_SIZE", "100"))
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _finished_before(cutoff: datetime):
+    """
+    Filter for experiments that reached a terminal state before cutoff.
+    Rows created before finished_at existed fall back to created_at.
+    """
+    return or_(
+        Experiment.finished_at < cutoff,
+        (Experiment.finished_at.is_(None)) & (Experiment.created_at < cutoff),
+    )
+
+def purge_experiment(db, experiment_id: str) -> None:
+    """
+    Physically deletes an experiment and everything hanging off it.
+    The caller owns the transaction.
+    """
+    status = db.query(Experiment.status).filter(Experiment.id == experiment_id).scalar()
+    unindex_experiment(db, experiment_id)
+    db.query(Message).filter(Message.experiment_id == experiment_id).delete(synchronize_session=False)
+    db.query(ArchivedConversation).filter(
+        ArchivedConversation.experiment_id == experiment_id
+    ).delete(synchronize_session=False)
+    db.query(LoopState).filter(LoopState.experiment_id == experiment_id).delete(synchronize_session=False)
+    if db.query(Experiment).filter(Experiment.id == experiment_id).delete(synchronize_session=False):
+        record_purged(db, status)
+
+class RetentionJob:
+    """
+    Background archival, purge and vacuum scheduling for finished experiments.
+    """
+    def __init__(self, session_factory: Callable, policy: Optional[RetentionPolicy] = None, interval: float = 60):
+        self.session_factory = session_factory
+        self.policy = policy or RetentionPolicy()
+        self._last_vacuum = time.monotonic()
+        self._job = PeriodicJob("retention", interval, self.run_once)
+
+    def start(self):
+        self._job.start()
+
+    def stop(self):
+        self._job.stop()
+
+    def run_once(self) -> dict:
+        """
+        Runs a single maintenance pass and returns what it did.
+        """
+        db = self.session_factory()
+        try:
+            purged = self._purge(db)
+            archived = self._archive(db)
+        finally:
+            db.close()
+        if purged:
+            self._reclaim(full=False)
+        if self.policy.vacuum_interval and time.monotonic() - self._last_vacuum >= self.policy.vacuum_interval:
+            self._reclaim(full=True)
+            self._last_vacuum = time.monotonic()
+        if purged or archived:
+            logger.info(f"Retention pass: purged {purged}, archived {archived} experiments")
+        return {"purged": purged, "archived": archived}
+
+    def _purge(self, db) -> int:
+        conditions = [Experiment.deleted_at.isnot(None)]
+        if self.policy.retention is not None:
+            conditions.append(
+                Experiment.status.in_(TERMINAL_STATUSES) & _finished_before(_utcnow() - self.policy.retention)
+            )
+        ids = [
+            row.id for row in
+            db.query(Experiment.id).filter(or_(*conditions)).limit(self.policy.batch_size).all()
+        ]
+        for experiment_id in ids:
+            try:
+                purge_experiment(db, experiment_id)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Failed to purge experiment {experiment_id}: {str(e)}")
+        return len(ids)
+
+    def _archive(self, db) -> int:
+        candidates = (
+            db.query(Experiment.id)
+            .outerjoin(ArchivedConversation, ArchivedConversation.experiment_id == Experiment.id)
+            .filter(
+                ArchivedConversation.experiment_id.is_(None),
+                Experiment.deleted_at.is_(None),
+                Experiment.status.in_(TERMINAL_STATUSES),
+                _finished_before(_utcnow() - self.policy.archive_after),
+            )
+            .limit(self.policy.batch_size)
+            .all()
+        )
+        archived = 0
+        for row in candidates:
+            try:
+                if archive_experiment(db, row.id):
+                    archived += 1
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Failed to archive experiment {row.id}: {str(e)}")
+        return archived
+
+    def _reclaim(self, full: bool) -> None:
+        """
+        Returns free pages to the filesystem. SQLite only; Postgres relies on autovacuum.
+        """
+        if not is_sqlite(engine):
+            return
+        try:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                if full:
+                    conn.execute(text("VACUUM"))
+                    logger.info("Ran full VACUUM")
+                else:
+                    conn.execute(text("PRAGMA incremental_vacuum"))
+        except Exception as e:
+            logger.error(f"Vacuum failed: {str(e)}")
@@ -0,0 +1,47 @@
+import threading
+from typing import Dict
+
+class Metrics:
+    """
+    Thread-safe, process-local counters and summaries, exposed at /metrics.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._summaries: Dict[str, Dict[str, float]] = {}
+        self._gauges: Dict[str, float] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set(self, name: str, value: float) -> None:
+        """
+        Records the current value of a gauge (e.g. an adaptive limit).
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Records one observation (count, sum, min, max) for a named series.
+        """
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                self._summaries[name] = {"count": 1, "sum": value, "min": value, "max": value}
+                return
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["min"] = min(summary["min"], value)
+            summary["max"] = max(summary["max"], value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            summaries = {
+                name: {**s, "avg": s["sum"] / s["count"]}
+                for name, s in self._summaries.items()
+            }
+            return {"counters": dict(self._counters), "gauges": dict(self._gauges), "summaries": summaries}
+
+metrics = Metrics()
@@ -1,9 +1,18 @@
-from sqlalchemy import Column, String, Text, DateTime, Enum, ForeignKey, Integer
+from sqlalchemy import Boolean, Column, String, Text, DateTime, Enum, ForeignKey, Integer, LargeBinary
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql import func
 
 Base = declarative_base()
 
+class Batch(Base):
+    __tablename__ = "batches"
+
+    id = Column(String, primary_key=True)  # UUID4
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    experiments = relationship("Experiment", back_populates="batch")
+
 class Experiment(Base):
     __tablename__ = "experiments"
 
@@ -18,13 +27,21 @@ class Experiment(Base):
         ),
         default='pending'
     )
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())  # Added for messages
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    deleted_at = Column(DateTime(timezone=True), nullable=True)  # Soft delete; rows are purged in the background
+    batch_id = Column(String, ForeignKey("batches.id"), nullable=True, index=True)
 
     messages = relationship("Message", back_populates="experiment")
+    archive = relationship("ArchivedConversation", back_populates="experiment", uselist=False)
+    batch = relationship("Batch", back_populates="experiments")
 
 class Message(Base):
     __tablename__ = "messages"
+    # Archival deletes the newest rows; without AUTOINCREMENT SQLite would
+    # hand their ids out again. Applies to databases created from now on
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     experiment_id = Column(String, ForeignKey("experiments.id"), nullable=False)
@@ -32,4 +49,64 @@ class Message(Base):
     content = Column(Text, nullable=False)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
-    experiment = relationship("Experiment", back_populates="messages")
\ No newline at end of file
+    experiment = relationship("Experiment", back_populates="messages")
+
+class ArchivedConversation(Base):
+    __tablename__ = "archived_conversations"
+
+    experiment_id = Column(String, ForeignKey("experiments.id"), primary_key=True)
+    codec = Column(String, nullable=False)  # 'zlib' or 'zstd'
+    payload = Column(LargeBinary, nullable=False)  # Compressed JSON list of messages
+    message_count = Column(Integer, nullable=False)
+    raw_size = Column(Integer, nullable=False)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    experiment = relationship("Experiment", back_populates="archive")
+
+class Worker(Base):
+    __tablename__ = "workers"
+
+    url = Column(String, primary_key=True)  # Base URL the web tier uses to reach the worker
+    environment = Column(String, nullable=True)  # Kernels on workers sharing this name have the same packages
+    capacity = Column(Integer, nullable=False)
+    active = Column(Integer, nullable=False, default=0)
+    last_heartbeat = Column(DateTime(timezone=True), server_default=func.now())
+
+class LoopState(Base):
+    __tablename__ = "loop_states"
+
+    experiment_id = Column(String, ForeignKey("experiments.id"), primary_key=True)
+    iteration = Column(Integer, nullable=False, default=0)  # Completed iterations
+    last_code = Column(Text, nullable=True)
+    last_result = Column(Text, nullable=True)
+    pending_code = Column(Text, nullable=True)  # LLM answered but the code has not run yet
+    cells = Column(Text, nullable=False, default="[]")  # JSON list of cells run in the kernel, for replay
+    needs_replay = Column(Boolean, nullable=False, default=False)
+    owner = Column(String, nullable=True)  # Process currently driving the loop
+    deadline_at = Column(DateTime(timezone=True), nullable=True)  # Wall-clock limit, kept across resumes
+    tokens_used = Column(Integer, nullable=False, default=0)  # Estimated LLM tokens, kept across resumes
+    heartbeat_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class StatCounter(Base):
+    __tablename__ = "stat_counters"
+
+    name = Column(String, primary_key=True)  # e.g. 'status.running', 'messages.assistant'
+    value = Column(Integer, nullable=False, default=0)
+
+class ModelRollup(Base):
+    __tablename__ = "model_rollups"
+
+    model = Column(String, primary_key=True)  # 'client:model'
+    started = Column(Integer, nullable=False, default=0)
+    finished = Column(Integer, nullable=False, default=0)
+    succeeded = Column(Integer, nullable=False, default=0)
+    success_iterations = Column(Integer, nullable=False, default=0)  # Summed over iteration_successes
+    iteration_successes = Column(Integer, nullable=False, default=0)  # Successes with a known iteration count
+
+class LatencyBucket(Base):
+    __tablename__ = "latency_buckets"
+
+    series = Column(String, primary_key=True)  # 'llm', 'iteration' or 'experiment'
+    bucket = Column(Integer, primary_key=True)  # Index into stats.LATENCY_BUCKETS
+    count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,269 @@
+import os
+import re
+import json
+import time
+import random
+import logging
+import threading
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# How often blocked callers re-check their cancelled hook
+CANCEL_POLL_SECONDS = 0.25
+
+class CallCancelled(Exception):
+    """
+    Raised by ProviderLimiter.call once its caller gave up on the call.
+    """
+
+def _sleep(seconds: float, cancelled: Optional[Callable[[], bool]] = None):
+    """
+    time.sleep that raises CallCancelled early once `cancelled` returns True.
+    """
+    deadline = time.monotonic() + seconds
+    while True:
+        if cancelled is not None and cancelled():
+            raise CallCancelled()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, CANCEL_POLL_SECONDS) if cancelled is not None else remaining)
+
+class TokenBucket:
+    """
+    Refills at `rate` units per second up to `capacity`. Reservations may
+    drive the balance negative, which queues callers in arrival order.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes `amount` units and returns how long the caller must wait before using them.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= min(amount, self.capacity)
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit: grows by roughly one slot per window of
+    successful calls, halves on throttling and shrinks gently when latency
+    exceeds the target.
+    """
+    def __init__(self, initial: float, minimum: float, maximum: float, latency_target: float):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, cancelled: Optional[Callable[[], bool]] = None):
+        with self._cond:
+            while self._in_flight >= int(self.limit):
+                if cancelled is not None and cancelled():
+                    raise CallCancelled()
+                self._cond.wait(CANCEL_POLL_SECONDS if cancelled is not None else None)
+            self._in_flight += 1
+
+    def release(self, latency: Optional[float] = None, throttled: bool = False):
+        with self._cond:
+            self._in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+            elif latency is not None and latency > self.latency_target:
+                self.limit = max(self.minimum, self.limit * 0.9)
+            elif latency is not None:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+def is_rate_limited(error: Exception) -> bool:
+    """
+    Recognizes provider throttling: gRPC RESOURCE_EXHAUSTED (xAI SDK) or an HTTP 429.
+    """
+    code = getattr(error, "code", None)
+    if callable(code):
+        try:
+            if getattr(code(), "name", None) == "RESOURCE_EXHAUSTED":
+                return True
+        except Exception:
+            pass
+    if getattr(error, "status_code", None) == 429:
+        return True
+    text = str(error).lower()
+    return "429" in text or "rate limit" in text or "resource_exhausted" in text
+
+def retry_after(error: Exception) -> Optional[float]:
+    """
+    Extracts a server retry-after hint, in seconds, if the error carries one.
+    """
+    metadata = getattr(error, "trailing_metadata", None)
+    if callable(metadata):
+        try:
+            for key, value in metadata() or ():
+                if key.lower() in ("retry-after", "retry-after-ms"):
+                    seconds = float(value)
+                    return seconds / 1000 if key.lower() == "retry-after-ms" else seconds
+        except Exception:
+            pass
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers and headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    match = re.search(r"retry[- ]after[^0-9]*([0-9.]+)", str(error), re.IGNORECASE)
+    return float(match.group(1)) if match else None
+
+class ProviderLimiter:
+    """
+    Shared limiter for one provider/model: request and token budgets,
+    adaptive concurrency, and jittered backoff that honours retry-after.
+    When the provider throttles, every caller of this limiter pauses until
+    the retry-after deadline instead of retrying in lockstep.
+    """
+    def __init__(self, key: str, rpm: float, tpm: float, max_concurrency: int,
+                 latency_target: float, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.key = key
+        self.requests = TokenBucket(rpm / 60, max(1, rpm / 10))
+        self.tokens = TokenBucket(tpm / 60, max(1, tpm / 10))
+        self.concurrency = AdaptiveConcurrency(
+            initial=max(1, max_concurrency / 2), minimum=1, maximum=max_concurrency,
+            latency_target=latency_target,
+        )
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _admit(self, estimated_tokens: int, cancelled: Optional[Callable[[], bool]] = None) -> float:
+        """
+        Blocks until the call may start and returns the queueing delay.
+        """
+        start = time.monotonic()
+        with self._lock:
+            paused = self._paused_until - start
+        if paused > 0:
+            _sleep(paused, cancelled)
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        if wait > 0:
+            _sleep(wait, cancelled)
+        self.concurrency.acquire(cancelled)
+        if cancelled is not None and cancelled():
+            self.concurrency.release()
+            raise CallCancelled()
+        return time.monotonic() - start
+
+    def backoff(self, attempt: int, hint: Optional[float]) -> float:
+        """
+        Full-jitter exponential backoff, never shorter than the server's hint.
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if hint is not None:
+            delay = hint + random.uniform(0, max(0.5, hint * 0.1))
+        return delay
+
+    def call(self, fn: Callable[[], T], estimated_tokens: int, max_retries: int = 3,
+             cancelled: Optional[Callable[[], bool]] = None) -> T:
+        """
+        Runs fn under the limiter, retrying failures with jittered backoff.
+        Once `cancelled` returns True the call stops waiting for admission
+        and is not retried, raising CallCancelled; a request already in
+        flight holds its concurrency slot until it returns or times out.
+        """
+        for attempt in range(max_retries):
+            try:
+                queue_delay = self._admit(estimated_tokens, cancelled)
+            except CallCancelled:
+                metrics.incr(f"llm.{self.key}.cancelled")
+                raise
+            metrics.observe("llm.queue_delay_seconds", queue_delay)
+            metrics.observe(f"llm.{self.key}.queue_delay_seconds", queue_delay)
+            started = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                throttled = is_rate_limited(e)
+                self.concurrency.release(throttled=throttled)
+                metrics.set(f"llm.{self.key}.concurrency_limit", self.concurrency.limit)
+                if throttled:
+                    metrics.incr(f"llm.{self.key}.throttled")
+                if attempt == max_retries - 1:
+                    raise
+                if cancelled is not None and cancelled():
+                    metrics.incr(f"llm.{self.key}.cancelled")
+                    raise CallCancelled() from e
+                hint = retry_after(e)
+                delay = self.backoff(attempt, hint)
+                if throttled:
+                    self._pause(delay)
+                metrics.incr(f"llm.{self.key}.retries")
+                logger.warning(f"{self.key} attempt {attempt + 1} failed ({str(e)}); retrying in {delay:.1f}s")
+                try:
+                    _sleep(delay, cancelled)
+                except CallCancelled:
+                    metrics.incr(f"llm.{self.key}.cancelled")
+                    raise
+                continue
+            latency = time.monotonic() - started
+            self.concurrency.release(latency=latency)
+            metrics.observe(f"llm.{self.key}.latency_seconds", latency)
+            metrics.set(f"llm.{self.key}.concurrency_limit", self.concurrency.limit)
+            return result
+        raise RuntimeError("max_retries must be at least 1")
+
+def _limits_for(key: str) -> Dict[str, float]:
+    """
+    Defaults from LLM_RPM, LLM_TPM, LLM_MAX_CONCURRENCY and LLM_LATENCY_TARGET,
+    overridable per key with LLM_LIMITS='{"grok:grok-3": {"rpm": 120}}'.
+    """
+    limits = {
+        "rpm": float(os.getenv("LLM_RPM", "60")),
+        "tpm": float(os.getenv("LLM_TPM", "100000")),
+        "max_concurrency": int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+        "latency_target": float(os.getenv("LLM_LATENCY_TARGET", "30")),
+    }
+    try:
+        limits.update(json.loads(os.getenv("LLM_LIMITS", "{}")).get(key, {}))
+    except json.JSONDecodeError as e:
+        logger.error(f"Ignoring invalid LLM_LIMITS: {str(e)}")
+    return limits
+
+_limiters: Dict[Tuple[str, str], ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(provider: str, model: str) -> ProviderLimiter:
+    """
+    Returns the process-wide limiter shared by every client of provider/model.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get((provider, model))
+        if limiter is None:
+            key = f"{provider}:{model}"
+            limits = _limits_for(key)
+            limiter = ProviderLimiter(
+                key,
+                rpm=limits["rpm"],
+                tpm=limits["tpm"],
+                max_concurrency=int(limits["max_concurrency"]),
+                latency_target=limits["latency_target"],
+            )
+            _limiters[(provider, model)] = limiter
+        return limiter
@@ -0,0 +1,63 @@
+import os
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Tuple
+
+from ai_clients import AIClient, get_client
+
+logger = logging.getLogger(__name__)
+
+class ExperimentScheduler:
+    """
+    Bounded worker pool for queued experiments (batches).
+    Settings:
+      MAX_CONCURRENT_EXPERIMENTS  experiments running at once (default 4)
+    """
+    def __init__(self, max_workers: int = None):
+        max_workers = max_workers or int(os.getenv("MAX_CONCURRENT_EXPERIMENTS", "4"))
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="experiment")
+        self._clients: Dict[Tuple[str, str], AIClient] = {}
+        self._clients_lock = threading.Lock()
+
+    def client_for(self, name: str, model: str) -> AIClient:
+        """
+        Returns a shared client per provider/model instead of one per experiment.
+        """
+        key = (name.lower(), model)
+        with self._clients_lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = get_client(name, model)
+                self._clients[key] = client
+            return client
+
+    def submit(self, fn: Callable, *args) -> Future:
+        return self._pool.submit(fn, *args)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> ExperimentScheduler:
+    """
+    Returns the process-wide scheduler, created on first use so that
+    no threads exist before gunicorn forks its workers.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ExperimentScheduler()
+        return _scheduler
+
+def shutdown_scheduler() -> None:
+    """
+    Stops the process-wide scheduler if it was ever started.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.shutdown()
+            _scheduler = None
@@ -0,0 +1,164 @@
+import re
+import logging
+from typing import List, Optional
+
+from sqlalchemy import inspect, text
+
+from archive import unpack
+from db import is_sqlite
+from models import ArchivedConversation, Message
+
+logger = logging.getLogger(__name__)
+
+# SQLite: standalone FTS5 table (not external-content) so hits survive
+# archival of the underlying messages. It keeps its own rowid: message ids
+# are reused once archival deletes the highest rows, so they cannot be the key.
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE messages_fts USING fts5("
+    "content, message_id UNINDEXED, experiment_id UNINDEXED, sender UNINDEXED, tokenize='unicode61')"
+)
+
+# Postgres: plain table with a generated tsvector and a GIN index.
+POSTGRES_DDL = [
+    "CREATE TABLE message_search ("
+    "message_id INTEGER PRIMARY KEY, experiment_id VARCHAR NOT NULL, sender VARCHAR NOT NULL, "
+    "content TEXT NOT NULL, tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED)",
+    "CREATE INDEX ix_message_search_tsv ON message_search USING GIN (tsv)",
+    "CREATE INDEX ix_message_search_experiment ON message_search (experiment_id)",
+]
+
+def _index_table(bind) -> str:
+    return "messages_fts" if is_sqlite(bind) else "message_search"
+
+def init_search_index(engine) -> None:
+    """
+    Creates the full-text index if missing and backfills it from existing
+    live and archived messages. Called from init_db.
+    """
+    table = _index_table(engine)
+    if table in inspect(engine).get_table_names():
+        if not is_sqlite(engine):
+            return
+        with engine.begin() as conn:
+            columns = {row[1] for row in conn.execute(text("PRAGMA table_info(messages_fts)"))}
+            if "message_id" in columns:
+                return
+            # Earlier layout keyed on the message id; rebuild it
+            conn.execute(text("DROP TABLE messages_fts"))
+            logger.info("Rebuilding full-text index with its own rowid")
+    with engine.begin() as conn:
+        if is_sqlite(engine):
+            conn.execute(text(SQLITE_DDL))
+        else:
+            for statement in POSTGRES_DDL:
+                conn.execute(text(statement))
+    logger.info(f"Created full-text index {table}")
+    _backfill(engine)
+
+def _backfill(engine) -> None:
+    from sqlalchemy.orm import Session
+
+    indexed = 0
+    with Session(bind=engine) as db:
+        for m in db.query(Message).yield_per(500):
+            index_message(db, m.id, m.experiment_id, m.sender, m.content)
+            indexed += 1
+        for archived in db.query(ArchivedConversation).yield_per(1):
+            for m in unpack(archived):
+                index_message(db, m.id, archived.experiment_id, m.sender, m.content)
+                indexed += 1
+        db.commit()
+    logger.info(f"Backfilled {indexed} messages into the full-text index")
+
+def index_message(db, message_id: int, experiment_id: str, sender: str, content: str) -> None:
+    """
+    Adds one message to the index inside the caller's transaction.
+    """
+    table = _index_table(db.get_bind())
+    if table == "messages_fts":
+        statement = "INSERT INTO messages_fts (message_id, content, experiment_id, sender) VALUES (:id, :content, :eid, :sender)"
+    else:
+        statement = "INSERT INTO message_search (message_id, content, experiment_id, sender) VALUES (:id, :content, :eid, :sender)"
+    db.execute(text(statement), {"id": message_id, "content": content, "eid": experiment_id, "sender": sender})
+
+def unindex_experiment(db, experiment_id: str) -> None:
+    """
+    Removes every indexed message of an experiment (used when purging).
+    """
+    table = _index_table(db.get_bind())
+    db.execute(text(f"DELETE FROM {table} WHERE experiment_id = :eid"), {"eid": experiment_id})
+
+def to_fts5_query(query: str) -> str:
+    """
+    Turns free text (tracebacks, quotes, colons) into a safe FTS5 query:
+    every token is quoted, and all tokens must match.
+    """
+    tokens = re.findall(r"\w+", query, re.UNICODE)
+    return " ".join(f'"{token}"' for token in tokens)
+
+def search_messages(
+    db,
+    query: str,
+    sender: Optional[str] = None,
+    status: Optional[str] = None,
+    model: Optional[str] = None,
+    raw: bool = False,
+    limit: int = 20,
+    offset: int = 0,
+) -> List[dict]:
+    """
+    Returns ranked message hits with snippets, best match first.
+    With raw=True the query is passed through in the backend's own syntax
+    (FTS5 MATCH or websearch_to_tsquery); otherwise it is treated as plain text.
+    """
+    filters = ["e.deleted_at IS NULL"]
+    params = {"limit": limit, "offset": offset}
+    if sender:
+        filters.append("f.sender = :sender")
+        params["sender"] = sender
+    if status:
+        filters.append("e.status = :status")
+        params["status"] = status
+    if model:
+        filters.append("e.model = :model")
+        params["model"] = model
+
+    if is_sqlite(db.get_bind()):
+        params["q"] = query if raw else to_fts5_query(query)
+        if not params["q"]:
+            return []
+        statement = f"""
+            SELECT f.message_id, f.experiment_id, f.sender, e.status, e.ai_client, e.model,
+                   snippet(messages_fts, 0, '[', ']', '...', 16) AS snippet,
+                   bm25(messages_fts) AS score
+            FROM messages_fts f JOIN experiments e ON e.id = f.experiment_id
+            WHERE messages_fts MATCH :q AND {' AND '.join(filters)}
+            ORDER BY score
+            LIMIT :limit OFFSET :offset
+        """
+    else:
+        params["q"] = query
+        tsquery = "websearch_to_tsquery('simple', :q)" if raw else "plainto_tsquery('simple', :q)"
+        statement = f"""
+            SELECT f.message_id, f.experiment_id, f.sender, e.status, e.ai_client, e.model,
+                   ts_headline('simple', f.content, {tsquery}, 'StartSel=[,StopSel=],MaxWords=16') AS snippet,
+                   -ts_rank(f.tsv, {tsquery}) AS score
+            FROM message_search f JOIN experiments e ON e.id = f.experiment_id
+            WHERE f.tsv @@ {tsquery} AND {' AND '.join(filters)}
+            ORDER BY score
+            LIMIT :limit OFFSET :offset
+        """
+
+    rows = db.execute(text(statement), params).mappings().all()
+    return [
+        {
+            "experiment_id": row["experiment_id"],
+            "message_id": row["message_id"],
+            "sender": row["sender"],
+            "status": row["status"],
+            "model": f"{row['ai_client']}:{row['model']}",
+            "snippet": row["snippet"],
+            "score": -row["score"],  # Higher is better for callers
+        }
+        for row in rows
+    ]
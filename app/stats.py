@@ -0,0 +1,242 @@
+import bisect
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import func as sql_func, inspect
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql import func
+
+from archive import TERMINAL_STATUSES
+from models import Experiment, LatencyBucket, LoopState, Message, ModelRollup, StatCounter
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets; one overflow bucket follows
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+PERCENTILES = (0.5, 0.9, 0.99)
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _add(db, model, keys: dict, deltas: dict) -> None:
+    """
+    Atomically adds `deltas` to the row identified by `keys`, creating it
+    if missing. Runs inside the caller's transaction.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(model).values(**keys, **deltas)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: getattr(model, name) + statement.excluded[name] for name in deltas},
+        )
+        db.execute(statement)
+        return
+    query = db.query(model).filter_by(**keys)
+    if not query.update({getattr(model, name): getattr(model, name) + value for name, value in deltas.items()},
+                        synchronize_session=False):
+        db.add(model(**keys, **deltas))
+        db.flush()
+
+def _model_key(experiment) -> str:
+    return f"{experiment.ai_client}:{experiment.model}"
+
+def _incr(db, name: str, value: int = 1) -> None:
+    _add(db, StatCounter, {"name": name}, {"value": value})
+
+def record_created(db, model: str, count: int = 1) -> None:
+    """
+    Counts newly inserted pending experiments for `model` ('client:model').
+    """
+    _incr(db, "status.pending", count)
+    _add(db, ModelRollup, {"model": model}, {"started": count})
+
+def move_status(db, previous: Optional[str], status: str) -> None:
+    """
+    Moves one experiment between status counters (for bulk UPDATEs that
+    bypass set_status).
+    """
+    if previous == status:
+        return
+    if previous is not None:
+        _incr(db, f"status.{previous}", -1)
+    _incr(db, f"status.{status}", 1)
+
+def set_status(db, experiment, status: str, iterations: Optional[int] = None) -> bool:
+    """
+    Moves an experiment from the status the caller last saw to `status` and
+    updates the rollups in the same transaction; the caller commits.
+    The move is a conditional UPDATE, so a session holding a stale status
+    (e.g. a loop whose experiment was stopped by another process) changes
+    nothing, and a finished experiment never becomes active again. Returns
+    False in that case, with experiment.status refreshed from the database.
+    Reaching a terminal state also stamps finished_at and records the
+    outcome and duration once. `iterations` is the number of completed
+    iterations when the experiment succeeds.
+    """
+    previous = experiment.status
+    if previous == status or (previous in TERMINAL_STATUSES and status not in TERMINAL_STATUSES):
+        return False
+    finishing = status in TERMINAL_STATUSES and previous not in TERMINAL_STATUSES
+    values = {Experiment.status: status}
+    if finishing:
+        values[Experiment.finished_at] = sql_func.coalesce(Experiment.finished_at, func.now())
+    updated = (
+        db.query(Experiment)
+        .filter(Experiment.id == experiment.id, Experiment.status == previous)
+        .update(values, synchronize_session=False)
+    )
+    if updated != 1:
+        current = db.query(Experiment.status).filter(Experiment.id == experiment.id).scalar()
+        set_committed_value(experiment, "status", current)
+        logger.info(f"Experiment {experiment.id} is {current}, not {previous}; not moving it to {status}")
+        return False
+    set_committed_value(experiment, "status", status)
+    move_status(db, previous, status)
+    if not finishing:
+        return True
+
+    db.expire(experiment, ["finished_at"])
+    succeeded = status == "success"
+    _add(db, ModelRollup, {"model": _model_key(experiment)}, {
+        "finished": 1,
+        "succeeded": 1 if succeeded else 0,
+        "success_iterations": iterations if succeeded and iterations is not None else 0,
+        "iteration_successes": 1 if succeeded and iterations is not None else 0,
+    })
+    created_at = experiment.created_at
+    if created_at is not None:
+        if created_at.tzinfo is not None:
+            created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+        observe_latency(db, "experiment", max((_utcnow() - created_at).total_seconds(), 0))
+    return True
+
+def record_message(db, sender: str) -> None:
+    _incr(db, f"messages.{sender}")
+
+def record_purged(db, status: Optional[str]) -> None:
+    """
+    Drops a physically deleted experiment from the status counts. Model
+    rollups and latencies are lifetime figures and are kept.
+    """
+    if status is not None:
+        _incr(db, f"status.{status}", -1)
+
+def observe_latency(db, series: str, seconds: float) -> None:
+    _add(db, LatencyBucket, {"series": series, "bucket": bisect.bisect_left(LATENCY_BUCKETS, seconds)}, {"count": 1})
+
+def percentiles(counts: Dict[int, int]) -> dict:
+    """
+    Estimates percentiles from bucket counts, interpolating linearly
+    within the bucket that holds each rank.
+    """
+    total = sum(counts.values())
+    result = {"count": total}
+    for p in PERCENTILES:
+        if not total:
+            result[f"p{int(p * 100)}"] = None
+            continue
+        rank = p * total
+        seen = 0
+        for bucket in range(len(LATENCY_BUCKETS) + 1):
+            count = counts.get(bucket, 0)
+            if count and seen + count >= rank:
+                if bucket >= len(LATENCY_BUCKETS):
+                    value = LATENCY_BUCKETS[-1]
+                else:
+                    lower = LATENCY_BUCKETS[bucket - 1] if bucket else 0.0
+                    value = lower + (LATENCY_BUCKETS[bucket] - lower) * (rank - seen) / count
+                result[f"p{int(p * 100)}"] = round(value, 3)
+                break
+            seen += count
+    return result
+
+def get_stats(db) -> dict:
+    """
+    Dashboard aggregates, read from the rollup tables only; the cost does
+    not grow with the number of experiments or messages. Status counts
+    cover experiments currently stored; per-model figures, message counts
+    and latencies are lifetime totals.
+    """
+    counters = {row.name: row.value for row in db.query(StatCounter).all()}
+    statuses = {name[len("status."):]: value for name, value in counters.items() if name.startswith("status.")}
+    senders = {name[len("messages."):]: value for name, value in counters.items() if name.startswith("messages.")}
+
+    models: List[dict] = []
+    finished = succeeded = success_iterations = iteration_successes = 0
+    for rollup in db.query(ModelRollup).order_by(ModelRollup.model).all():
+        finished += rollup.finished
+        succeeded += rollup.succeeded
+        success_iterations += rollup.success_iterations
+        iteration_successes += rollup.iteration_successes
+        models.append({
+            "model": rollup.model,
+            "started": rollup.started,
+            "finished": rollup.finished,
+            "succeeded": rollup.succeeded,
+            "success_rate": rollup.succeeded / rollup.finished if rollup.finished else None,
+            "avg_iterations_to_success": (
+                rollup.success_iterations / rollup.iteration_successes if rollup.iteration_successes else None
+            ),
+        })
+
+    buckets: Dict[str, Dict[int, int]] = {}
+    for row in db.query(LatencyBucket).all():
+        buckets.setdefault(row.series, {})[row.bucket] = row.count
+
+    return {
+        "status_counts": statuses,
+        "messages": {"total": sum(senders.values()), "by_sender": senders},
+        "success_rate": succeeded / finished if finished else None,
+        "avg_iterations_to_success": success_iterations / iteration_successes if iteration_successes else None,
+        "models": models,
+        "latency_seconds": {series: percentiles(counts) for series, counts in buckets.items()},
+    }
+
+def init_stats(engine) -> None:
+    """
+    Seeds the counters from existing rows the first time they are created,
+    so databases that predate them start with correct totals. Called from
+    init_db; latency histograms start empty.
+    """
+    from sqlalchemy.orm import Session
+
+    if "stat_counters" not in inspect(engine).get_table_names():
+        return
+    with Session(bind=engine) as db:
+        if db.query(StatCounter).first() is not None or db.query(Experiment.id).first() is None:
+            return
+        for status, count in db.query(Experiment.status, sql_func.count()).group_by(Experiment.status):
+            _incr(db, f"status.{status}", count)
+        for sender, count in db.query(Message.sender, sql_func.count()).group_by(Message.sender):
+            _incr(db, f"messages.{sender}", count)
+        grouped = db.query(
+            Experiment.ai_client, Experiment.model, Experiment.status, sql_func.count()
+        ).group_by(Experiment.ai_client, Experiment.model, Experiment.status)
+        for ai_client, model, status, count in grouped:
+            terminal = status in TERMINAL_STATUSES
+            _add(db, ModelRollup, {"model": f"{ai_client}:{model}"}, {
+                "started": count,
+                "finished": count if terminal else 0,
+                "succeeded": count if status == "success" else 0,
+            })
+        # Successes that predate loop state have no iteration count; the
+        # average only covers the ones that do
+        iterations = (
+            db.query(Experiment.ai_client, Experiment.model, sql_func.sum(LoopState.iteration), sql_func.count())
+            .join(LoopState, LoopState.experiment_id == Experiment.id)
+            .filter(Experiment.status == "success")
+            .group_by(Experiment.ai_client, Experiment.model)
+        )
+        for ai_client, model, total, count in iterations:
+            _add(db, ModelRollup, {"model": f"{ai_client}:{model}"}, {
+                "success_iterations": total or 0,
+                "iteration_successes": count,
+            })
+        db.commit()
+    logger.info("Seeded dashboard counters from existing experiments")
@@ -0,0 +1,246 @@
+import os
+import re
+import ast
+import json
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from executor import ExecutionResult
+
+logger = logging.getLogger(__name__)
+
+# Calls that hang or damage the kernel rather than fail usefully.
+# Override with VALIDATION_FORBIDDEN="input,os.system,..."
+DEFAULT_FORBIDDEN = (
+    "input", "exit", "quit", "sys.exit", "os._exit", "os.system",
+    "os.fork", "os.kill", "shutil.rmtree",
+)
+
+MODULE_CACHE_TTL = float(os.getenv("VALIDATION_MODULE_CACHE_TTL", "600"))
+
+# Run inside the kernel; leaves no names behind in the user namespace
+LIST_MODULES_SNIPPET = (
+    "import json as _v_json, sys as _v_sys, pkgutil as _v_pkgutil\n"
+    "print(_v_json.dumps(sorted(set(_v_sys.builtin_module_names) | set(_v_sys.modules) | "
+    "{_m.name for _m in _v_pkgutil.iter_modules()})))\n"
+    "del _v_json, _v_sys, _v_pkgutil"
+)
+
+IMPORT_ERRORS = {"ImportError", "ModuleNotFoundError", "Exception", "BaseException"}
+
+# `!pip install`, `%pip install`, subprocess calls running pip, ...
+PIP_INSTALL = re.compile(r"\bpip3?\b\W{0,6}install\b")
+
+_module_cache: Dict[str, Tuple[float, FrozenSet[str]]] = {}
+_module_cache_lock = threading.Lock()
+
+@dataclass
+class ValidationResult:
+    """
+    Problems found in a code cell before it reaches the kernel.
+    """
+    errors: List[str] = field(default_factory=list)
+    kind: Optional[str] = None  # 'SyntaxError', 'ModuleNotFoundError' or 'PolicyViolation'
+    kernel_executions: int = 0  # Cells validation itself ran (module listing on a cache miss)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def add(self, kind: str, message: str):
+        self.kind = self.kind or kind
+        self.errors.append(message)
+
+    def as_execution_result(self) -> ExecutionResult:
+        """
+        Presents the failure the way the loop presents kernel errors.
+        """
+        text = "Code was rejected before execution and did not run:\n" + "\n".join(
+            f"- {error}" for error in self.errors
+        )
+        return ExecutionResult(error=text, ename=self.kind, evalue=self.errors[0])
+
+def _environment_key(executor) -> str:
+    return getattr(executor, "environment_key", "local:python3")
+
+def cached_modules(executor) -> Optional[FrozenSet[str]]:
+    """
+    The cached module list of the executor's environment, or None once it
+    expired or was invalidated.
+    """
+    with _module_cache_lock:
+        cached = _module_cache.get(_environment_key(executor))
+    if cached and time.monotonic() - cached[0] < MODULE_CACHE_TTL:
+        return cached[1]
+    return None
+
+def kernel_modules(executor) -> FrozenSet[str]:
+    """
+    Top-level module names importable in the executor's kernel, cached per
+    kernel environment for MODULE_CACHE_TTL seconds or until invalidated.
+    """
+    cached = cached_modules(executor)
+    if cached is not None:
+        return cached
+
+    key = _environment_key(executor)
+    now = time.monotonic()
+    result = executor.execute_structured(LIST_MODULES_SNIPPET)
+    if not result.ok:
+        raise RuntimeError(f"Could not list kernel modules: {result.evalue}")
+    modules = frozenset(json.loads(result.output))
+    with _module_cache_lock:
+        _module_cache[key] = (now, modules)
+    logger.info(f"Cached {len(modules)} importable modules for {key}")
+    return modules
+
+def invalidate_modules(executor) -> None:
+    """
+    Forgets the module list of the executor's environment, e.g. after a
+    cell installed packages into it.
+    """
+    with _module_cache_lock:
+        _module_cache.pop(_environment_key(executor), None)
+
+def runs_pip_install(code: str) -> bool:
+    return bool(PIP_INSTALL.search(code))
+
+def _strip_magics(code: str) -> str:
+    """
+    Replaces IPython line magics and shell escapes with `pass` so the rest
+    of the cell can be parsed as plain Python.
+    """
+    lines = []
+    for line in code.splitlines():
+        stripped = line.lstrip()
+        if stripped.startswith(("%", "!")):
+            lines.append(line[: len(line) - len(stripped)] + "pass")
+        else:
+            lines.append(line)
+    return "\n".join(lines)
+
+def _guarded_nodes(tree: ast.AST) -> Set[int]:
+    """
+    ids of nodes inside `try:` blocks that handle import failures.
+    """
+    guarded = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Try):
+            continue
+        handles = False
+        for handler in node.handlers:
+            if handler.type is None:
+                handles = True
+            else:
+                types = handler.type.elts if isinstance(handler.type, ast.Tuple) else [handler.type]
+                handles = handles or any(isinstance(t, ast.Name) and t.id in IMPORT_ERRORS for t in types)
+        if handles:
+            for stmt in node.body:
+                guarded.update(id(child) for child in ast.walk(stmt))
+    return guarded
+
+def _call_name(func: ast.AST, aliases: Dict[str, str]) -> Optional[str]:
+    parts = []
+    while isinstance(func, ast.Attribute):
+        parts.append(func.attr)
+        func = func.value
+    if not isinstance(func, ast.Name):
+        return None
+    parts.append(aliases.get(func.id, func.id))
+    return ".".join(reversed(parts))
+
+class CodeValidator:
+    """
+    Cheap local checks run before a candidate is sent to the kernel:
+    syntax, import resolution against the kernel's installed packages,
+    and a forbidden-call policy.
+    """
+    def __init__(self, executor, forbidden: Optional[List[str]] = None):
+        self.executor = executor
+        if forbidden is None:
+            configured = os.getenv("VALIDATION_FORBIDDEN")
+            forbidden = configured.split(",") if configured is not None else DEFAULT_FORBIDDEN
+        self.forbidden = {name.strip() for name in forbidden if name.strip()}
+
+    def validate(self, code: str) -> ValidationResult:
+        result = ValidationResult()
+        if code.lstrip().startswith("%%"):
+            return result  # Cell magics (%%bash, %%time, ...) are not Python
+
+        try:
+            tree = compile(
+                _strip_magics(code), "<cell>", "exec",
+                flags=ast.PyCF_ONLY_AST | ast.PyCF_ALLOW_TOP_LEVEL_AWAIT,
+            )
+        except SyntaxError as e:
+            line = (e.text or "").rstrip()
+            result.add("SyntaxError", f"SyntaxError on line {e.lineno}: {e.msg}" + (f"\n    {line}" if line else ""))
+            return result
+
+        # Distribution names (scikit-learn, pyyaml) do not map to module
+        # names, so a cell that installs packages is not import-checked
+        if not runs_pip_install(code):
+            self._check_imports(code, tree, result)
+        self._check_policy(tree, result)
+        return result
+
+    def executed(self, code: str):
+        """
+        Called after a cell ran in the kernel; installs change what is importable.
+        """
+        if runs_pip_install(code):
+            invalidate_modules(self.executor)
+
+    def _check_imports(self, code: str, tree: ast.AST, result: ValidationResult):
+        # The cache is dropped whenever a cell installs packages (see executed),
+        # so a listing is only run again once the TTL expires
+        try:
+            available = cached_modules(self.executor)
+            if available is None:
+                result.kernel_executions += 1
+                available = kernel_modules(self.executor)
+            missing = self._missing_imports(code, tree, available)
+        except Exception as e:
+            logger.warning(f"Skipping import check: {str(e)}")
+            return
+        for top in missing:
+            result.add("ModuleNotFoundError", f"ModuleNotFoundError: No module named '{top}' is installed in the kernel")
+
+    @staticmethod
+    def _missing_imports(code: str, tree: ast.AST, available: FrozenSet[str]) -> List[str]:
+        guarded = _guarded_nodes(tree)
+        missing = []
+        for node in ast.walk(tree):
+            if id(node) in guarded:
+                continue
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                top = name.split(".")[0]
+                if top in available or f"{top}.py" in code:
+                    continue
+                if top not in missing:
+                    missing.append(top)
+        return missing
+
+    def _check_policy(self, tree: ast.AST, result: ValidationResult):
+        aliases = {}
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    aliases[alias.asname or alias.name] = alias.name
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                for alias in node.names:
+                    aliases[alias.asname or alias.name] = f"{node.module}.{alias.name}"
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call):
+                name = _call_name(node.func, aliases)
+                if name in self.forbidden:
+                    result.add("PolicyViolation", f"PolicyViolation on line {node.lineno}: calling {name}() is not allowed in this environment")
@@ -1,26 +1,173 @@
-from fastapi import WebSocket
-from typing import Dict, List
+import os
 import json
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from fastapi import WebSocket
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+try:  # Optional: several times faster than the json module
+    import orjson
+except ImportError:  # pragma: no cover - depends on the deployment
+    orjson = None
+
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+# What to do when a client's queue is full: 'drop' the event for that client
+# or 'disconnect' it (it reloads and catches up from the database)
+SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "disconnect")
+CLOSE_TIMEOUT = 5.0
+
+def encode(message: dict) -> str:
+    """
+    Serialises an event once; the result is shared by every recipient.
+    """
+    if orjson is not None:
+        return orjson.dumps(message).decode("utf-8")
+    return json.dumps(message)
+
+class Connection:
+    """
+    One client socket with its own bounded send queue, drained by a writer
+    task so a slow client only ever delays itself.
+    """
+    def __init__(self, experiment_id: str, websocket: WebSocket, queue_size: int):
+        self.experiment_id = experiment_id
+        self.websocket = websocket
+        self.queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+        self.lagging = False
+        self.writer: Optional[asyncio.Task] = None
+
+    async def _write(self):
+        try:
+            while True:
+                payload = await self.queue.get()
+                if payload is None:
+                    break
+                await self.websocket.send_text(payload)
+                if self.lagging and self.queue.qsize() < self.queue.maxsize // 2:
+                    self.lagging = False
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.info(f"WebSocket send failed for experiment {self.experiment_id}: {str(e)}")
+        finally:
+            self.closed = True
 
 class WebSocketManager:
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-
-    async def register(self, experiment_id: str, websocket: WebSocket):
-        if experiment_id not in self.active_connections:
-            self.active_connections[experiment_id] = []
-        self.active_connections[experiment_id].append(websocket)
-
-    def unregister(self, experiment_id: str, websocket: WebSocket):
-        if experiment_id in self.active_connections:
-            self.active_connections[experiment_id].remove(websocket)
-            if not self.active_connections[experiment_id]:
-                del self.active_connections[experiment_id]
-
-    async def broadcast(self, experiment_id: str, message: dict):
-        if experiment_id in self.active_connections:
-            for connection in self.active_connections[experiment_id]:
-                try:
-                    await connection.send_text(json.dumps(message))
-                except Exception as e:
-                    self.unregister(experiment_id, connection)
\ No newline at end of file
+    """
+    Per-experiment fan-out of events to connected progress pages.
+    """
+    def __init__(self, queue_size: int = SEND_QUEUE_SIZE, policy: str = SLOW_CONSUMER_POLICY):
+        self.queue_size = queue_size
+        self.policy = policy
+        self.active_connections: Dict[str, List[Connection]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def register(self, experiment_id: str, websocket: WebSocket) -> Connection:
+        """
+        Tracks an accepted socket and starts its writer task.
+        """
+        self.loop = asyncio.get_running_loop()
+        connection = Connection(experiment_id, websocket, self.queue_size)
+        connection.writer = asyncio.create_task(connection._write())
+        self.active_connections.setdefault(experiment_id, []).append(connection)
+        metrics.incr("ws.connections_opened")
+        return connection
+
+    async def unregister(self, connection: Connection):
+        """
+        Stops tracking a connection, letting its writer flush what is queued.
+        """
+        connections = self.active_connections.get(connection.experiment_id, [])
+        if connection in connections:
+            connections.remove(connection)
+            if not connections:
+                del self.active_connections[connection.experiment_id]
+        if connection.writer is None or connection.writer.done():
+            return
+        try:
+            await asyncio.wait_for(self._drain(connection), CLOSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            connection.writer.cancel()
+
+    @staticmethod
+    async def _drain(connection: Connection):
+        await connection.queue.put(None)  # Waits for room when the queue is full
+        await connection.writer
+
+    async def send(self, connection: Connection, message: dict) -> bool:
+        """
+        Queues an event for one connection, waiting for room in its queue.
+        Used for the initial snapshot and the connection's own polling, which
+        must arrive in full; the slow-consumer policy applies to broadcasts only.
+        """
+        payload = encode(message)
+        while not connection.closed:
+            try:
+                await asyncio.wait_for(connection.queue.put(payload), timeout=1)
+                return True
+            except asyncio.TimeoutError:
+                continue  # Re-check whether the writer gave up
+        return False
+
+    def broadcast(self, experiment_id: str, message: dict) -> int:
+        """
+        Queues an event for every client of an experiment without waiting
+        on any of them. Returns the number of clients it was queued for.
+        """
+        connections = list(self.active_connections.get(experiment_id, []))
+        if not connections:
+            return 0
+        payload = encode(message)
+        metrics.incr("ws.events_broadcast")
+        return sum(self._enqueue(connection, payload) for connection in connections)
+
+    def publish(self, experiment_id: str, message: dict) -> None:
+        """
+        Thread-safe broadcast() for code outside the event loop, such as
+        feedback loops streaming kernel output while a cell runs.
+        """
+        loop = self.loop
+        if loop is None or loop.is_closed() or experiment_id not in self.active_connections:
+            return
+        try:
+            loop.call_soon_threadsafe(self.broadcast, experiment_id, message)
+        except RuntimeError:
+            pass  # Event loop shut down in the meantime
+
+    def _enqueue(self, connection: Connection, payload: str) -> bool:
+        if connection.closed:
+            return False
+        try:
+            connection.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            return self._slow_consumer(connection)
+        if not connection.lagging and connection.queue.qsize() >= connection.queue.maxsize // 2:
+            connection.lagging = True
+            metrics.incr("ws.lagging_clients")
+        return True
+
+    def _slow_consumer(self, connection: Connection) -> bool:
+        if self.policy == "drop":
+            metrics.incr("ws.events_dropped")
+            return False
+        logger.warning(f"Disconnecting slow WebSocket client of experiment {connection.experiment_id}")
+        metrics.incr("ws.slow_disconnects")
+        connection.closed = True
+        connection.writer.cancel()
+        asyncio.create_task(self._close(connection.websocket))
+        return False
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)  # Try again later
+        except Exception:
+            pass
+
+manager = WebSocketManager()
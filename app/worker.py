@@ -0,0 +1,280 @@
+"""
+Remote execution worker.
+
+Hosts Jupyter kernels for the web tier over a small HTTP/JSON protocol:
+  GET    /health                    capacity, active leases, environment
+  POST   /kernels                   lease a new kernel -> {"kernel_id": ...}; 409 when full
+  POST   /kernels/<id>/execute      {"code", "timeout"} -> NDJSON stream of
+                                    {"type": "output", "text"} ... {"type": "result", ...}
+  POST   /kernels/<id>/interrupt    interrupt the cell currently running
+  DELETE /kernels/<id>              release the lease and shut the kernel down
+
+Workers register with the web tier by heartbeating to POST /workers/heartbeat.
+Several workers can run on one machine for local testing:
+    python worker.py --port 9001 --register http://localhost:8000
+    python worker.py --port 9002 --register http://localhost:8000
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import argparse
+import threading
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from executor import ExecutionResult, JupyterExecutor
+
+logger = logging.getLogger(__name__)
+
+WORKER_TOKEN_HEADER = "X-Worker-Token"
+
+class Lease:
+    def __init__(self, executor: JupyterExecutor):
+        self.executor = executor
+        self.lock = threading.Lock()  # One cell at a time per kernel
+        self.last_used = time.monotonic()
+
+class KernelHost:
+    """
+    Owns the kernels leased out by this worker.
+    """
+    def __init__(self, capacity: int, environment: Optional[str], lease_ttl: float):
+        self.capacity = capacity
+        self.environment = environment
+        self.lease_ttl = lease_ttl
+        self._leases: Dict[str, Lease] = {}
+        self._lock = threading.Lock()
+        self._reserved = 0
+
+    @property
+    def active(self) -> int:
+        with self._lock:
+            return len(self._leases) + self._reserved
+
+    def lease(self) -> Optional[str]:
+        with self._lock:
+            if len(self._leases) + self._reserved >= self.capacity:
+                return None
+            self._reserved += 1
+        try:
+            executor = JupyterExecutor()
+        finally:
+            with self._lock:
+                self._reserved -= 1
+        kernel_id = str(uuid.uuid4())
+        with self._lock:
+            self._leases[kernel_id] = Lease(executor)
+        logger.info(f"Leased kernel {kernel_id} ({self.active}/{self.capacity})")
+        return kernel_id
+
+    def get(self, kernel_id: str) -> Optional[Lease]:
+        with self._lock:
+            return self._leases.get(kernel_id)
+
+    def release(self, kernel_id: str) -> bool:
+        with self._lock:
+            lease = self._leases.pop(kernel_id, None)
+        if lease is None:
+            return False
+        lease.executor.shutdown()
+        logger.info(f"Released kernel {kernel_id}")
+        return True
+
+    def reap_expired(self):
+        """
+        Releases leases idle longer than lease_ttl, e.g. when the web tier
+        died without releasing them.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                kernel_id for kernel_id, lease in self._leases.items()
+                if now - lease.last_used > self.lease_ttl and not lease.lock.locked()
+            ]
+        for kernel_id in expired:
+            logger.warning(f"Lease {kernel_id} expired")
+            self.release(kernel_id)
+
+    def shutdown(self):
+        with self._lock:
+            kernel_ids = list(self._leases)
+        for kernel_id in kernel_ids:
+            self.release(kernel_id)
+
+class WorkerHandler(BaseHTTPRequestHandler):
+    host: KernelHost = None
+    token: Optional[str] = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self) -> bool:
+        if self.token and self.headers.get(WORKER_TOKEN_HEADER) != self.token:
+            self._send_json(401, {"error": "Invalid worker token"})
+            return False
+        return True
+
+    def _kernel_path(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) >= 2 and parts[0] == "kernels":
+            return parts[1], parts[2] if len(parts) > 2 else None
+        return None, None
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {
+                "capacity": self.host.capacity,
+                "active": self.host.active,
+                "environment": self.host.environment,
+            })
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path == "/kernels":
+            try:
+                kernel_id = self.host.lease()
+            except Exception as e:
+                logger.error(f"Failed to start kernel: {str(e)}")
+                self._send_json(500, {"error": str(e)})
+                return
+            if kernel_id is None:
+                self._send_json(409, {"error": "Worker at capacity"})
+            else:
+                self._send_json(201, {"kernel_id": kernel_id})
+            return
+
+        kernel_id, action = self._kernel_path()
+        if action not in ("execute", "interrupt"):
+            self._send_json(404, {"error": "Not found"})
+            return
+        lease = self.host.get(kernel_id)
+        if lease is None:
+            self._send_json(404, {"error": "Unknown kernel"})
+            return
+        if action == "interrupt":
+            # Deliberately not under lease.lock, which the running cell holds
+            lease.executor.interrupt()
+            self._send_json(200, {"interrupted": kernel_id})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        # No Content-Length: the stream ends when the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+
+        def emit(event: dict):
+            self.wfile.write(json.dumps(event).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+        with lease.lock:
+            lease.last_used = time.monotonic()
+            try:
+                result = lease.executor.execute_structured(
+                    request.get("code", ""),
+                    timeout=int(request.get("timeout", 30)),
+                    on_output=lambda text: emit({"type": "output", "text": text}),
+                )
+            except Exception as e:
+                logger.error(f"Execution failed on kernel {kernel_id}: {str(e)}")
+                result = ExecutionResult(error=f"Worker error: {str(e)}", ename="WorkerError", evalue=str(e))
+            lease.last_used = time.monotonic()
+        emit({"type": "result", **asdict(result)})
+
+    def do_DELETE(self):
+        if not self._authorized():
+            return
+        kernel_id, action = self._kernel_path()
+        if kernel_id is None or action is not None:
+            self._send_json(404, {"error": "Not found"})
+        elif self.host.release(kernel_id):
+            self._send_json(200, {"released": kernel_id})
+        else:
+            self._send_json(404, {"error": "Unknown kernel"})
+
+def heartbeat_loop(host: KernelHost, register_url: str, advertise_url: str, token: Optional[str], interval: float):
+    """
+    Reports capacity and load to the web tier and reaps expired leases.
+    """
+    import requests
+
+    headers = {WORKER_TOKEN_HEADER: token} if token else {}
+    while True:
+        host.reap_expired()
+        try:
+            requests.post(
+                f"{register_url.rstrip('/')}/workers/heartbeat",
+                json={
+                    "url": advertise_url,
+                    "capacity": host.capacity,
+                    "active": host.active,
+                    "environment": host.environment,
+                },
+                headers=headers,
+                timeout=5,
+            ).raise_for_status()
+        except Exception as e:
+            logger.warning(f"Heartbeat to {register_url} failed: {str(e)}")
+        time.sleep(interval)
+
+def main():
+    from logging_config import configure_logging
+
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Remote Jupyter execution worker")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--capacity", type=int, default=int(os.getenv("WORKER_CAPACITY", "4")))
+    parser.add_argument("--environment", default=os.getenv("WORKER_ENVIRONMENT"),
+                        help="Name shared by workers with identical packages")
+    parser.add_argument("--register", default=os.getenv("WORKER_REGISTER_URL"),
+                        help="Web tier base URL to heartbeat to")
+    parser.add_argument("--advertise", default=os.getenv("WORKER_ADVERTISE_URL"),
+                        help="URL the web tier should use to reach this worker")
+    parser.add_argument("--lease-ttl", type=float, default=3600)
+    parser.add_argument("--heartbeat-interval", type=float, default=10)
+    args = parser.parse_args()
+
+    token = os.getenv("WORKER_TOKEN")
+    if args.register and not token:
+        parser.error("--register requires WORKER_TOKEN; the web tier rejects unauthenticated workers")
+    host = KernelHost(args.capacity, args.environment, args.lease_ttl)
+    WorkerHandler.host = host
+    WorkerHandler.token = token
+    server = ThreadingHTTPServer((args.host, args.port), WorkerHandler)
+    server.daemon_threads = True
+
+    if args.register:
+        advertise = args.advertise or f"http://localhost:{args.port}"
+        threading.Thread(
+            target=heartbeat_loop,
+            args=(host, args.register, advertise, token, args.heartbeat_interval),
+            daemon=True,
+        ).start()
+
+    logger.info(f"Worker listening on {args.host}:{args.port} with capacity {args.capacity}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        host.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# The app uses flat imports and reads DATABASE_PATH at import time
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(), "db.sqlite3")
+os.environ.setdefault("RETENTION_ENABLED", "false")
+os.environ.setdefault("LOOP_RECOVERY_ENABLED", "false")
@@ -0,0 +1,96 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import archive
+from archive import archive_experiment, load_messages
+from conversation import Conversation
+from db import SessionLocal, init_db
+from maintenance import RetentionJob, RetentionPolicy
+from models import ArchivedConversation, Experiment, Message
+
+init_db()
+
+CONTENTS = ["print('héllo')", "Traceback (most recent call last):\n  ZeroDivisionError", "x" * 5000]
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _experiment(db, status="success", finished_ago=None, **fields) -> str:
+    experiment_id = str(uuid.uuid4())
+    finished_at = _utcnow() - finished_ago if finished_ago is not None else None
+    db.add(Experiment(id=experiment_id, prompt="p", ai_client="grok", model="grok-3", status=status,
+                      finished_at=finished_at, **fields))
+    conversation = Conversation(db, experiment_id)
+    for sender, content in zip(("user", "system", "assistant"), CONTENTS):
+        conversation.append(sender, content)
+    db.commit()
+    return experiment_id
+
+def _policy(**overrides) -> RetentionPolicy:
+    policy = RetentionPolicy()
+    policy.archive_after = timedelta(seconds=60)
+    policy.retention = None
+    policy.vacuum_interval = 0
+    for name, value in overrides.items():
+        setattr(policy, name, value)
+    return policy
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+@pytest.mark.parametrize("codec", ["zlib", "zstd"])
+def test_archive_round_trip(db, monkeypatch, codec):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    else:
+        monkeypatch.setattr(archive, "zstandard", None)
+    experiment_id = _experiment(db)
+    before = [(m.id, m.sender, m.content, m.timestamp) for m in load_messages(db, experiment_id)]
+
+    assert archive_experiment(db, experiment_id)
+    db.commit()
+    assert not archive_experiment(db, experiment_id)  # Idempotent
+
+    stored = db.query(ArchivedConversation).get(experiment_id)
+    assert stored.codec == codec
+    assert stored.message_count == 3 and len(stored.payload) < stored.raw_size
+    assert db.query(Message).filter(Message.experiment_id == experiment_id).count() == 0
+    after = [(m.id, m.sender, m.content, m.timestamp) for m in load_messages(db, experiment_id)]
+    assert after == before
+
+def test_zstd_archive_without_the_package_fails_clearly(monkeypatch):
+    pytest.importorskip("zstandard")
+    codec, payload = archive.compress(b"[]")
+    monkeypatch.setattr(archive, "zstandard", None)
+    with pytest.raises(RuntimeError, match="zstandard"):
+        archive.decompress(codec, payload)
+
+def test_retention_archives_finished_and_purges_deleted(db):
+    due = _experiment(db, finished_ago=timedelta(hours=1))
+    recent = _experiment(db, finished_ago=timedelta(seconds=1))
+    running = _experiment(db, status="running")
+    deleted = _experiment(db, status="stopped", finished_ago=timedelta(seconds=1), deleted_at=_utcnow())
+
+    RetentionJob(SessionLocal, policy=_policy(batch_size=1000)).run_once()
+
+    archived = {row.experiment_id for row in db.query(ArchivedConversation.experiment_id)}
+    assert due in archived
+    assert recent not in archived and running not in archived
+    assert db.query(Experiment).get(deleted) is None
+    assert db.query(Message).filter(Message.experiment_id == deleted).count() == 0
+    assert [m.content for m in load_messages(db, due)] == CONTENTS
+
+def test_retention_purges_experiments_past_the_retention_period(db):
+    old = _experiment(db, finished_ago=timedelta(days=40))
+    kept = _experiment(db, finished_ago=timedelta(days=2))
+
+    RetentionJob(SessionLocal, policy=_policy(retention=timedelta(days=30), batch_size=1000)).run_once()
+
+    assert db.query(Experiment).get(old) is None
+    assert db.query(ArchivedConversation).get(old) is None
+    assert db.query(Experiment).get(kept) is not None
@@ -0,0 +1,26 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+@pytest.mark.parametrize("body", [
+    ["a"],
+    "a",
+    {"prompts": "a", "models": ["grok:grok-3"]},
+    {"prompts": ["a"], "models": 5},
+    {"prompts": ["a"], "models": [1]},
+    {"prompts": ["a"], "models": ["grok-3"]},
+])
+def test_malformed_json_batches_are_rejected(client, body):
+    response = client.post("/batches", json=body)
+    assert response.status_code == 400
+    assert response.json()["detail"]
+
+def test_non_utf8_uploads_are_rejected(client):
+    response = client.post("/batches", files={"file": ("prompts.jsonl", b"\xff\xfe")}, data={"models": "grok:grok-3"})
+    assert response.status_code == 400
@@ -0,0 +1,102 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import cancellation
+from cancellation import Cancelled, CancellationToken
+from db import SessionLocal, init_db
+from loop_state import claim_new, load_state, loop_deadline
+from models import Experiment
+from rate_limiter import CallCancelled, ProviderLimiter
+
+init_db()
+
+def _limiter(max_concurrency: int = 1) -> ProviderLimiter:
+    return ProviderLimiter("test", rpm=6000, tpm=10 ** 9, max_concurrency=max_concurrency, latency_target=30)
+
+def test_cancelled_caller_leaves_the_queue_without_calling():
+    limiter = _limiter()
+    limiter.concurrency.acquire()  # Another caller holds the only slot
+    stop = threading.Event()
+    calls = []
+    errors = []
+
+    def caller():
+        try:
+            limiter.call(lambda: calls.append(1), estimated_tokens=1, cancelled=stop.is_set)
+        except CallCancelled as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=caller)
+    thread.start()
+    time.sleep(0.3)
+    stop.set()
+    thread.join(timeout=2)
+
+    assert not thread.is_alive()
+    assert errors and not calls
+    assert limiter.concurrency._in_flight == 1  # Only the slot held by the other caller
+
+def test_failed_call_is_not_retried_once_cancelled():
+    limiter = _limiter()
+    stop = threading.Event()
+    attempts = []
+
+    def failing():
+        attempts.append(1)
+        stop.set()  # The caller gives up while this attempt is in flight
+        raise ConnectionError("upstream reset")
+
+    with pytest.raises(CallCancelled):
+        limiter.call(failing, estimated_tokens=1, max_retries=5, cancelled=stop.is_set)
+    assert len(attempts) == 1
+    assert limiter.concurrency._in_flight == 0
+
+def test_token_run_stops_the_abandoned_call_from_queueing():
+    limiter = _limiter()
+    limiter.concurrency.acquire()
+    token = CancellationToken("run-test")
+    threading.Timer(0.2, token.cancel, args=("stopped by user",)).start()
+    started = time.monotonic()
+
+    with pytest.raises(Cancelled):
+        token.run(limiter.call, lambda: "late", 1, cancelled=lambda: token.cancelled)
+    assert time.monotonic() - started < 1
+    time.sleep(0.5)  # The helper thread notices within a poll interval
+    assert limiter.concurrency._in_flight == 1
+
+def test_deadline_and_usage_survive_a_resume():
+    experiment_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        db.add(Experiment(id=experiment_id, prompt="p", ai_client="grok", model="grok-3", status="running"))
+        claim_new(db, experiment_id)
+        db.commit()
+        first = loop_deadline(db, load_state(db, experiment_id), 3600)
+        load_state(db, experiment_id).tokens_used = 700
+        db.commit()
+    finally:
+        db.close()
+
+    db = SessionLocal()  # A later run, e.g. after recovery in another process
+    try:
+        state = load_state(db, experiment_id)
+        assert loop_deadline(db, state, 3600) == first
+        assert state.tokens_used == 700
+    finally:
+        db.close()
+
+def test_expired_deadline_cancels_the_resumed_loop():
+    past = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=5)
+    token = cancellation.register("expired", deadline_at=past, token_budget=1000, tokens_used=900)
+    try:
+        with pytest.raises(Cancelled, match="deadline"):
+            token.check()
+        token = CancellationToken("budget", token_budget=1000, tokens_used=900)
+        token.spend(100)
+        assert token.cancelled
+    finally:
+        cancellation.unregister("expired")
@@ -0,0 +1,37 @@
+from ai_clients import AIClient
+from convergence import ESCALATE, StagnationDetector, error_signature
+from executor import ExecutionResult
+
+def _error(ename: str, evalue: str) -> ExecutionResult:
+    return ExecutionResult(error=f"{ename}: {evalue}", ename=ename, evalue=evalue)
+
+def test_signature_masks_source_paths_only():
+    first = _error("SyntaxError", "invalid syntax (/tmp/ipykernel_41/2817.py, line 3)")
+    second = _error("SyntaxError", "invalid syntax (/tmp/ipykernel_97/12.py, line 9)")
+    assert error_signature(first) == error_signature(second) == "SyntaxError: invalid syntax (<path>, line N)"
+
+    frame = ExecutionResult(error='Traceback:\n  File "/srv/app/x.py", line 4\nNameError: name q is not defined')
+    assert error_signature(frame) == "Error: NameError: name q is not defined"
+
+def test_signature_keeps_text_that_only_contains_slashes():
+    pairs = [
+        ("ValueError", "cannot cast a/b to float", "cannot cast c/d to float"),
+        ("HTTPError", "404 for url https://api.example.com/v1/users", "404 for url https://api.example.com/v1/orders"),
+        ("TypeError", "unsupported operand type(s) for /: 'str' and 'int'", "unsupported operand type(s) for /: 'list' and 'int'"),
+    ]
+    for ename, first, second in pairs:
+        assert error_signature(_error(ename, first)) != error_signature(_error(ename, second))
+
+def test_different_errors_do_not_look_like_a_streak():
+    detector = StagnationDetector()
+    detector.observe("x = a / b", _error("ZeroDivisionError", "division by zero"))
+    assert detector.observe("y = c / d", _error("KeyError", "'c/d'")) != ESCALATE
+
+def test_nudges_reach_the_model_as_instructions():
+    history = [
+        {"sender": "user", "content": "plot it"},
+        {"sender": "system", "content": "raw model answer"},
+        {"sender": "nudge", "content": "try a different strategy"},
+    ]
+    messages = AIClient().map_history_to_agent(history)
+    assert [m["content"] for m in messages[1:]] == ["plot it", "try a different strategy"]
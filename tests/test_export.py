@@ -0,0 +1,60 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+pytest.importorskip("pyarrow")
+
+@pytest.fixture
+def created(monkeypatch):
+    """
+    Paths of the temporary files the export endpoint creates.
+    """
+    paths = []
+    real_mkstemp = tempfile.mkstemp
+
+    def mkstemp(*args, **kwargs):
+        fd, path = real_mkstemp(*args, **kwargs)
+        paths.append(path)
+        return fd, path
+
+    monkeypatch.setattr(main.tempfile, "mkstemp", mkstemp)
+    return paths
+
+def test_parquet_file_is_removed_after_sending(created):
+    with TestClient(main.app) as client:
+        response = client.get("/export", params={"format": "parquet", "table": "experiments"})
+    assert response.status_code == 200
+    assert response.content.startswith(b"PAR1")
+    assert created and not os.path.exists(created[0])
+
+def test_parquet_file_is_removed_when_writing_fails(created, monkeypatch):
+    def broken(records, table, path):
+        with open(path, "wb") as f:
+            f.write(b"partial")
+        raise ValueError("disk full")
+
+    monkeypatch.setattr(main, "write_parquet", broken)
+    with TestClient(main.app) as client, pytest.raises(ValueError):
+        client.get("/export", params={"format": "parquet"})
+    assert created and not os.path.exists(created[0])
+
+def test_temporary_file_is_removed_when_the_client_goes_away():
+    fd, path = tempfile.mkstemp()
+    os.write(fd, b"x" * 1024)
+    os.close(fd)
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("connection reset")
+
+    response = main.TemporaryFileResponse(path)
+    with pytest.raises(OSError):
+        asyncio.run(response({"type": "http", "method": "GET", "headers": []}, receive, send))
+    assert not os.path.exists(path)
@@ -0,0 +1,103 @@
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from conversation import Conversation
+from db import SessionLocal, init_db
+from http_cache import PayloadCache, make_payload, response_cache
+from models import Experiment
+
+init_db()
+
+def _payload(size: int):
+    return make_payload(b"x" * size, "application/json", None)
+
+def _experiment(status="success") -> str:
+    db = SessionLocal()
+    experiment_id = str(uuid.uuid4())
+    db.add(Experiment(id=experiment_id, prompt="p", ai_client="grok", model="grok-3", status=status,
+                      finished_at=datetime.now(timezone.utc).replace(tzinfo=None)))
+    Conversation(db, experiment_id).append("assistant", "done")
+    db.commit()
+    db.close()
+    return experiment_id
+
+@pytest.fixture
+def renders(monkeypatch):
+    """
+    Experiment ids whose messages were loaded to render a response.
+    """
+    loaded = []
+    real_load_messages = main.load_messages
+
+    def load_messages(db, experiment_id):
+        loaded.append(experiment_id)
+        return real_load_messages(db, experiment_id)
+
+    monkeypatch.setattr(main, "load_messages", load_messages)
+    return loaded
+
+def test_lru_evicts_the_least_recently_used_entry():
+    cache = PayloadCache(max_entries=2, max_bytes=1000)
+    cache.put("json", "a", _payload(10))
+    cache.put("json", "b", _payload(10))
+    assert cache.get("json", "a") is not None  # "b" is now the oldest
+    cache.put("json", "c", _payload(10))
+    assert cache.get("json", "b") is None
+    assert cache.get("json", "a") is not None and cache.get("json", "c") is not None
+    assert cache.stats() == {"entries": 2, "bytes": 20}
+
+def test_lru_is_bounded_by_size():
+    cache = PayloadCache(max_entries=10, max_bytes=100)
+    for key in "abc":
+        cache.put("json", key, _payload(40))
+    assert cache.get("json", "a") is None
+    assert cache.stats() == {"entries": 2, "bytes": 80}
+    cache.put("json", "big", _payload(101))  # Larger than the whole cache
+    assert cache.get("json", "big") is None
+    cache.put("json", "b", _payload(10))  # Replacing an entry releases its size
+    assert cache.stats() == {"entries": 2, "bytes": 50}
+    cache.invalidate("b")
+    assert cache.stats() == {"entries": 1, "bytes": 40}
+
+def test_finished_experiment_revalidates_without_loading_messages(renders):
+    experiment_id = _experiment()
+    with TestClient(main.app) as client:
+        first = client.get(f"/api/experiments/{experiment_id}")
+        assert first.status_code == 200
+        etag = first.headers["etag"]
+        assert first.json()["messages"][0]["content"] == "done"
+
+        second = client.get(f"/api/experiments/{experiment_id}", headers={"If-None-Match": etag})
+        assert second.status_code == 304 and second.content == b""
+        assert second.headers["etag"] == etag
+
+        since = client.get(f"/api/experiments/{experiment_id}",
+                           headers={"If-Modified-Since": first.headers["last-modified"]})
+        assert since.status_code == 304
+
+        cached = client.get(f"/api/experiments/{experiment_id}")
+        assert cached.status_code == 200 and cached.content == first.content
+    assert renders == [experiment_id]  # Rendered once, then served from the cache or a 304
+
+def test_running_experiment_is_rendered_every_time(renders):
+    experiment_id = _experiment(status="running")
+    with TestClient(main.app) as client:
+        first = client.get(f"/api/experiments/{experiment_id}")
+        second = client.get(f"/api/experiments/{experiment_id}", headers={"If-None-Match": first.headers["etag"]})
+    assert second.status_code == 304
+    assert renders == [experiment_id, experiment_id]
+    assert response_cache.get("json", experiment_id) is None
+
+def test_deleting_an_experiment_drops_its_cached_payloads():
+    experiment_id = _experiment()
+    with TestClient(main.app) as client:
+        etag = client.get(f"/api/experiments/{experiment_id}").headers["etag"]
+        assert response_cache.get("json", experiment_id) is not None
+        client.post(f"/delete/{experiment_id}", follow_redirects=False)
+        assert response_cache.get("json", experiment_id) is None
+        response = client.get(f"/api/experiments/{experiment_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 404
@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from rate_limiter import AdaptiveConcurrency, ProviderLimiter, TokenBucket, is_rate_limited, retry_after
+
+class Throttled(Exception):
+    status_code = 429
+
+def _limiter(max_concurrency: int = 8, latency_target: float = 30) -> ProviderLimiter:
+    return ProviderLimiter("test", rpm=60000, tpm=10 ** 9, max_concurrency=max_concurrency,
+                           latency_target=latency_target, base_delay=0.01, max_delay=0.05)
+
+def test_throttling_halves_the_limit_down_to_the_minimum():
+    concurrency = AdaptiveConcurrency(initial=8, minimum=1, maximum=16, latency_target=30)
+    for expected in (4, 2, 1, 1):
+        concurrency.acquire()
+        concurrency.release(throttled=True)
+        assert concurrency.limit == expected
+
+def test_successes_grow_the_limit_by_about_one_per_window():
+    concurrency = AdaptiveConcurrency(initial=2, minimum=1, maximum=4, latency_target=30)
+    for _ in range(2):  # One window at limit 2
+        concurrency.acquire()
+        concurrency.release(latency=0.1)
+    assert concurrency.limit == pytest.approx(2 + 1 / 2 + 1 / 2.5)
+    for _ in range(50):
+        concurrency.acquire()
+        concurrency.release(latency=0.1)
+    assert concurrency.limit == 4  # Capped at the maximum
+
+def test_slow_responses_shrink_the_limit_gently():
+    concurrency = AdaptiveConcurrency(initial=10, minimum=1, maximum=10, latency_target=1)
+    concurrency.acquire()
+    concurrency.release(latency=5)
+    assert concurrency.limit == pytest.approx(9)
+
+def test_limit_bounds_calls_in_flight():
+    limiter = _limiter(max_concurrency=4)  # Starts at half the maximum
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def call():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+
+    threads = [threading.Thread(target=limiter.call, args=(call, 1)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) <= 2 + 1  # Successes may open one more slot while the others run
+
+def test_throttled_call_backs_off_honours_retry_after_and_recovers():
+    limiter = _limiter(max_concurrency=8)
+    attempts = []
+
+    def flaky():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise Throttled("429 Too Many Requests, retry after 0.2 seconds")
+        return "ok"
+
+    assert limiter.call(flaky, estimated_tokens=1, max_retries=3) == "ok"
+    assert attempts[1] - attempts[0] >= 0.2
+    assert limiter.concurrency.limit == 2.5  # Halved from 4 by the throttle, +1/2 for the retry...
+    for _ in range(10):
+        limiter.call(lambda: None, estimated_tokens=1)
+    assert limiter.concurrency.limit > 4  # ...and grown back by later successes
+
+def test_throttle_pauses_other_callers_of_the_same_limiter():
+    limiter = _limiter()
+    throttled_at = []
+    other_started = []
+
+    def throttled_once():
+        if not throttled_at:
+            throttled_at.append(time.monotonic())
+            raise Throttled("retry-after: 0.3")
+
+    first = threading.Thread(target=limiter.call, args=(throttled_once, 1))
+    first.start()
+    time.sleep(0.05)
+    limiter.call(lambda: other_started.append(time.monotonic()), estimated_tokens=1)
+    first.join()
+    # The second caller waited out the server's retry-after instead of hammering it
+    assert other_started[0] - throttled_at[0] >= 0.3
+
+def test_token_bucket_queues_callers_once_empty():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve(1) == 0 and bucket.reserve(1) == 0
+    assert bucket.reserve(1) == pytest.approx(0.1, abs=0.02)
+
+def test_recognises_provider_throttling():
+    assert is_rate_limited(Throttled())
+    assert is_rate_limited(RuntimeError("RESOURCE_EXHAUSTED: quota"))
+    assert not is_rate_limited(ValueError("bad prompt"))
+    assert retry_after(RuntimeError("Rate limited. Retry-After: 7")) == 7
+    assert retry_after(ValueError("nothing")) is None
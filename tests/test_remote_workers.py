@@ -0,0 +1,142 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import pytest
+
+pytest.importorskip("ipykernel")
+pytest.importorskip("jupyter_client")
+requests = pytest.importorskip("requests")
+
+from conftest import APP_DIR
+from db import SessionLocal, init_db
+from executor_backends import RemoteBackend, record_heartbeat
+from models import Experiment, Worker
+from websocket_manager import manager as ws_manager
+
+TOKEN = "test-worker-token"
+
+init_db()
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _broken_kernel_path() -> str:
+    """
+    A JUPYTER_PATH whose python3 kernel exits at once, so leasing fails with a 500.
+    """
+    path = tempfile.mkdtemp()
+    spec_dir = os.path.join(path, "kernels", "python3")
+    os.makedirs(spec_dir)
+    with open(os.path.join(spec_dir, "kernel.json"), "w") as f:
+        json.dump({"argv": [sys.executable, "-c", "raise SystemExit(1)"], "display_name": "broken", "language": "python"}, f)
+    return path
+
+def _start_worker(port: int, **env) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "worker.py", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=APP_DIR,
+        env={**os.environ, "WORKER_TOKEN": TOKEN, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/health", timeout=1).raise_for_status()
+            return process
+        except requests.RequestException:
+            time.sleep(0.1)
+    process.kill()
+    pytest.fail(f"Worker on port {port} did not start")
+
+@pytest.fixture
+def workers():
+    """
+    Two local workers: the first fails every lease, the second works.
+    """
+    broken_port, healthy_port = _free_port(), _free_port()
+    processes = [
+        _start_worker(broken_port, JUPYTER_PATH=_broken_kernel_path()),
+        _start_worker(healthy_port),
+    ]
+    urls = [f"http://127.0.0.1:{broken_port}", f"http://127.0.0.1:{healthy_port}"]
+    db = SessionLocal()
+    try:
+        # The broken worker looks least loaded, so placement tries it first
+        record_heartbeat(db, urls[0], capacity=4, active=0, environment="test")
+        record_heartbeat(db, urls[1], capacity=4, active=1, environment="test")
+    finally:
+        db.close()
+    yield urls
+    for process in processes:
+        process.terminate()
+        process.wait(timeout=10)
+    db = SessionLocal()
+    try:
+        db.query(Worker).filter(Worker.url.in_(urls)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def test_failover_and_streamed_output(workers):
+    broken, healthy = workers
+    executor = RemoteBackend(SessionLocal, token=TOKEN).acquire()
+    try:
+        assert executor.worker_url == healthy
+
+        chunks = []
+        result = executor.execute_structured(
+            "import time\nprint('first', flush=True)\ntime.sleep(1)\nprint('second')",
+            on_output=lambda text: chunks.append((text, time.monotonic())),
+        )
+        finished = time.monotonic()
+        assert result.ok
+        assert "first" in result.output and "second" in result.output
+        assert [text.strip() for text, _ in chunks] == ["first", "second"]
+        # The first line arrived while the cell was still sleeping
+        assert finished - chunks[0][1] > 0.5
+    finally:
+        executor.shutdown()
+
+    db = SessionLocal()
+    try:
+        assert db.query(Worker).get(healthy).active == 2  # The lease was counted where it landed
+        assert db.query(Worker).get(broken).active == 0
+    finally:
+        db.close()
+
+def test_streamed_output_reaches_websocket_clients(workers):
+    from fastapi.testclient import TestClient
+    from main import app
+
+    db = SessionLocal()
+    experiment_id = str(uuid.uuid4())
+    db.add(Experiment(id=experiment_id, prompt="p", ai_client="grok", model="grok-3", status="running"))
+    db.commit()
+    db.close()
+
+    executor = RemoteBackend(SessionLocal, token=TOKEN).acquire()
+    try:
+        with TestClient(app) as client, client.websocket_connect(f"/ws/{experiment_id}") as ws:
+            deadline = time.monotonic() + 5
+            while experiment_id not in ws_manager.active_connections and time.monotonic() < deadline:
+                time.sleep(0.01)
+            # Runs on a non-event-loop thread, like the feedback loop does
+            runner = threading.Thread(target=executor.execute_structured, args=("print('streamed')",), kwargs={
+                "on_output": lambda text: ws_manager.publish(experiment_id, {"event": "output", "text": text}),
+            })
+            runner.start()
+            event = ws.receive_json()
+            runner.join(timeout=30)
+        assert event == {"event": "output", "text": "streamed\n"}
+    finally:
+        executor.shutdown()
@@ -0,0 +1,81 @@
+import logging
+import os
+import tempfile
+import uuid
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from archive import archive_experiment
+from conversation import Conversation
+from db import SessionLocal, init_db, initialize_database
+from models import Experiment
+from search import init_search_index, search_messages
+
+init_db()
+
+# The messages table as created before it was declared AUTOINCREMENT
+LEGACY_MESSAGES_DDL = (
+    "CREATE TABLE messages (id INTEGER NOT NULL PRIMARY KEY, "
+    "experiment_id VARCHAR NOT NULL REFERENCES experiments (id), sender VARCHAR NOT NULL, "
+    "content TEXT NOT NULL, timestamp DATETIME DEFAULT (CURRENT_TIMESTAMP))"
+)
+
+def _experiment(db, status="running") -> str:
+    experiment_id = str(uuid.uuid4())
+    db.add(Experiment(id=experiment_id, prompt="p", ai_client="grok", model="grok-3", status=status))
+    db.commit()
+    return experiment_id
+
+def _archive_then_append(db):
+    finished = _experiment(db, status="success")
+    archived_id = Conversation(db, finished).append("assistant", "archived traceback").id
+    archive_experiment(db, finished)
+    db.commit()
+    live = _experiment(db)
+    message = Conversation(db, live).append("user", "fresh question")
+    db.commit()
+    return finished, archived_id, live, message.id
+
+def _assert_hits(db, finished, archived_id, live, live_id):
+    hits = {(hit["experiment_id"], hit["message_id"]) for hit in search_messages(db, "archived")}
+    assert hits == {(finished, archived_id)}
+    hits = {(hit["experiment_id"], hit["message_id"]) for hit in search_messages(db, "fresh")}
+    assert hits == {(live, live_id)}
+
+def test_message_ids_are_not_reused_after_archive():
+    db = SessionLocal()
+    try:
+        finished, archived_id, live, live_id = _archive_then_append(db)
+        assert live_id > archived_id
+        _assert_hits(db, finished, archived_id, live, live_id)
+    finally:
+        db.close()
+
+def test_legacy_database_indexes_reused_message_ids():
+    """
+    Databases created before AUTOINCREMENT hand out the ids of archived rows
+    again; indexing the new messages must not collide with the archived ones.
+    """
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'legacy.sqlite3')}")
+    with engine.begin() as conn:
+        conn.execute(text(LEGACY_MESSAGES_DDL))
+    initialize_database(engine)
+    init_search_index(engine)
+
+    db = sessionmaker(bind=engine, expire_on_commit=False)()
+    try:
+        finished, archived_id, live, live_id = _archive_then_append(db)
+        assert live_id == archived_id  # The id really is reused
+        _assert_hits(db, finished, archived_id, live, live_id)
+    finally:
+        db.close()
+
+def test_invalid_query_is_a_client_error_not_a_session_error(caplog):
+    from main import app
+
+    with TestClient(app) as client, caplog.at_level(logging.INFO):
+        response = client.get("/api/search", params={"q": 'broken "quote', "raw": "true"})
+    assert response.status_code == 400
+    assert not [r for r in caplog.records if r.levelno >= logging.ERROR]
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import uuid
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from db import initialize_database
+from models import Experiment, LoopState
+from stats import get_stats, init_stats, set_status
+
+def _engine():
+    return create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'db.sqlite3')}")
+
+def _experiment(db, status: str, iterations=None) -> Experiment:
+    experiment = Experiment(id=str(uuid.uuid4()), prompt="p", ai_client="grok", model="grok-3", status=status)
+    db.add(experiment)
+    if iterations is not None:
+        db.add(LoopState(experiment_id=experiment.id, iteration=iterations))
+    return experiment
+
+def test_seeded_average_ignores_successes_without_loop_state():
+    """
+    Successes from before loop state existed count towards the success rate
+    but not towards the average number of iterations.
+    """
+    engine = _engine()
+    initialize_database(engine)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+    with Session() as db:
+        _experiment(db, "success")  # Legacy row without LoopState
+        _experiment(db, "success", iterations=2)
+        _experiment(db, "success", iterations=4)
+        _experiment(db, "failed", iterations=10)
+        db.commit()
+    init_stats(engine)
+
+    with Session() as db:
+        stats = get_stats(db)
+        assert stats["success_rate"] == 0.75
+        assert stats["avg_iterations_to_success"] == 3
+
+        running = _experiment(db, "running")
+        db.flush()
+        set_status(db, running, "success", iterations=6)
+        db.commit()
+        assert get_stats(db)["avg_iterations_to_success"] == 4
+
+def test_not_null_columns_are_added_with_their_default():
+    engine = _engine()
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE model_rollups (model VARCHAR PRIMARY KEY, started INTEGER NOT NULL, "
+            "finished INTEGER NOT NULL, succeeded INTEGER NOT NULL, success_iterations INTEGER NOT NULL)"
+        ))
+        conn.execute(text("INSERT INTO model_rollups VALUES ('grok:grok-3', 1, 1, 1, 3)"))
+    initialize_database(engine)
+
+    assert "iteration_successes" in {column["name"] for column in inspect(engine).get_columns("model_rollups")}
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT iteration_successes FROM model_rollups")).scalar() == 0
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import uuid
+
+from fastapi.testclient import TestClient
+
+from conversation import Conversation
+from db import SessionLocal, init_db
+from models import Experiment
+from websocket_manager import WebSocketManager
+
+init_db()
+
+class FakeSocket:
+    """
+    Stands in for a client; sends block until `gate` is opened.
+    """
+    def __init__(self, open_gate: bool = True):
+        self.sent = []
+        self.closed_with = None
+        self.gate = asyncio.Event()
+        if open_gate:
+            self.gate.set()
+
+    async def send_text(self, payload: str):
+        await self.gate.wait()
+        self.sent.append(json.loads(payload))
+
+    async def close(self, code: int):
+        self.closed_with = code
+
+def test_slow_client_is_disconnected_without_delaying_others():
+    async def scenario():
+        manager = WebSocketManager(queue_size=4, policy="disconnect")
+        slow, fast = FakeSocket(open_gate=False), FakeSocket()
+        slow_connection = manager.register("e", slow)
+        fast_connection = manager.register("e", fast)
+        delivered = []
+        for n in range(10):
+            delivered.append(manager.broadcast("e", {"n": n}))
+            await asyncio.sleep(0)  # The fast client's writer keeps up
+        await asyncio.sleep(0.05)
+        await manager.unregister(fast_connection)
+        await manager.unregister(slow_connection)
+        return delivered, slow, fast, slow_connection
+
+    delivered, slow, fast, slow_connection = asyncio.run(scenario())
+    assert slow_connection.closed and slow.closed_with == 1013
+    assert delivered[0] == 2 and delivered[-1] == 1
+    assert [event["n"] for event in fast.sent] == list(range(10))
+
+def test_drop_policy_keeps_the_client_and_skips_events():
+    async def scenario():
+        manager = WebSocketManager(queue_size=4, policy="drop")
+        slow = FakeSocket(open_gate=False)
+        connection = manager.register("e", slow)
+        for n in range(10):
+            manager.broadcast("e", {"n": n})
+        slow.gate.set()
+        await manager.unregister(connection)
+        return slow, connection
+
+    slow, connection = asyncio.run(scenario())
+    assert slow.closed_with is None
+    assert [event["n"] for event in slow.sent] == [0, 1, 2, 3]
+
+def test_snapshot_larger_than_the_queue_is_delivered_in_full():
+    async def scenario():
+        manager = WebSocketManager(queue_size=4, policy="disconnect")
+        socket = FakeSocket(open_gate=False)
+        connection = manager.register("e", socket)
+        asyncio.get_running_loop().call_later(0.05, socket.gate.set)
+        sent = [await manager.send(connection, {"n": n}) for n in range(50)]
+        await manager.unregister(connection)
+        return sent, socket, connection
+
+    sent, socket, connection = asyncio.run(scenario())
+    assert all(sent)
+    assert socket.closed_with is None
+    assert [event["n"] for event in socket.sent] == list(range(50))
+
+def test_history_longer_than_the_send_queue_reaches_the_client():
+    from main import app
+    from websocket_manager import SEND_QUEUE_SIZE
+
+    db = SessionLocal()
+    experiment_id = str(uuid.uuid4())
+    db.add(Experiment(id=experiment_id, prompt="p", ai_client="grok", model="grok-3", status="success"))
+    conversation = Conversation(db, experiment_id)
+    count = SEND_QUEUE_SIZE + 20
+    for n in range(count):
+        conversation.append("assistant", f"message {n}")
+    db.commit()
+    db.close()
+
+    with TestClient(app) as client, client.websocket_connect(f"/ws/{experiment_id}") as ws:
+        received = [ws.receive_json()["message"]["content"] for _ in range(count)]
+    assert received == [f"message {n}" for n in range(count)]